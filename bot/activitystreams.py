@@ -1,8 +1,9 @@
 import email.utils
-from   datetime import datetime
+from   datetime import datetime, timezone
+from   django.core.exceptions import ValidationError
+from   django.db.models import Q
 from   functools import wraps
-import itertools
-from   math import ceil
+from   urllib.parse import urlencode
 import uuid
 from   .absolute_url import absolute_reverse
 
@@ -16,6 +17,14 @@ def format_datetime(time):
 def now():
     return format_datetime(datetime.now())
 
+def object_id(obj):
+    """
+        The ID of an object which might be given either as a URL or as an embedded object.
+    """
+    if isinstance(obj, dict):
+        return obj.get('id')
+    return obj
+
 def unique_message_url(domain):
     return absolute_reverse('guid', domain=domain, guid=str(uuid.uuid4()))
 
@@ -41,26 +50,94 @@ def add_unique_id(domain, message):
     message['id'] = unique_message_url(domain)
     return message
 
+def encode_cursor(value, pk):
+    return f'{value.isoformat()}|{pk}'
+
+def decode_cursor(cursor, pk_field):
+    """
+        Decode a page cursor made by ``encode_cursor``, checking the primary key with the model's ``pk_field``. Raises ValueError if it's not valid.
+    """
+    value, pk = cursor.rsplit('|', 1)
+
+    value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo = timezone.utc)
+
+    try:
+        pk = pk_field.to_python(pk)
+    except ValidationError as e:
+        raise ValueError(f'Invalid primary key in page cursor: {pk}') from e
+
+    return value, pk
+
+def page_url(uid, **params):
+    return f"{uid}?{urlencode({'page': 'true', **params})}"
+
+def collection_page(queryset, order_field, serialize, uid, per_page, max_id=None, min_id=None):
+    """
+        One page of an OrderedCollection, newest items first.
+
+        Pages are found by keyset pagination on ``order_field``, with the primary key breaking ties: ``max_id`` gives the page of items before the one it identifies, and ``min_id`` the page of items after it.
+        Only ``per_page + 1`` rows are loaded, to tell whether there's another page.
+    """
+    params = {}
+
+    if min_id is not None:
+        value, pk = decode_cursor(min_id, queryset.model._meta.pk)
+        params['min_id'] = min_id
+        newer = Q(**{f'{order_field}__gt': value}) | Q(**{order_field: value, 'pk__gt': pk})
+        rows = list(queryset.filter(newer).order_by(order_field, 'pk')[:per_page+1])
+        has_prev = len(rows) > per_page
+        rows = rows[:per_page]
+        rows.reverse()
+        has_next = True
+    else:
+        if max_id is not None:
+            value, pk = decode_cursor(max_id, queryset.model._meta.pk)
+            params['max_id'] = max_id
+            older = Q(**{f'{order_field}__lt': value}) | Q(**{order_field: value, 'pk__lt': pk})
+            queryset = queryset.filter(older)
+        rows = list(queryset.order_by(f'-{order_field}', '-pk')[:per_page+1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_prev = max_id is not None
+
+    page = {
+        "type": "OrderedCollectionPage",
+        "id": page_url(uid, **params),
+        "partOf": uid,
+        "orderedItems": [serialize(row) for row in rows],
+    }
+
+    if rows and has_next:
+        last = rows[-1]
+        page['next'] = page_url(uid, max_id=encode_cursor(getattr(last, order_field), last.pk))
+    if rows and has_prev:
+        first = rows[0]
+        page['prev'] = page_url(uid, min_id=encode_cursor(getattr(first, order_field), first.pk))
+
+    return page
+
 def ordered_collection(per_page=20):
+    """
+        Make an OrderedCollection from a method which returns a tuple ``(queryset, order_field, serialize, collection_url)``.
+
+        The decorated method returns the collection, with its first page embedded, or if it's given ``page=True``, the page identified by the ``max_id`` or ``min_id`` cursor.
+    """
     def inner(fn):
         @wraps(fn)
         @with_context()
-        def wrapper(*args, page=0, **kwargs):
-            all_items, num_items, uid = fn(*args, **kwargs)
-            num_pages = ceil(num_items/per_page)
-            page_items = list(itertools.islice(all_items, page*per_page, (page+1)*per_page))
-            page_key = 'first' if page==0 else 'last' if page >= num_pages-1 else 'current'
+        def wrapper(*args, page=False, max_id=None, min_id=None, **kwargs):
+            queryset, order_field, serialize, uid = fn(*args, **kwargs)
+
+            if page:
+                return collection_page(queryset, order_field, serialize, uid, per_page, max_id=max_id, min_id=min_id)
+
             return {
                 "type": "OrderedCollection",
-                "totalItems": num_items,
+                "totalItems": queryset.count(),
                 "id": uid,
-                page_key: {
-                    "type": "OrderedCollectionPage",
-                    "totalItems": min(per_page, num_items - per_page*page),
-                    "partOf": uid,
-                    "orderedItems": page_items, 
-                    "id": f"{uid}?page={page}"
-                },
+                "first": collection_page(queryset, order_field, serialize, uid, per_page),
             }
 
         return wrapper
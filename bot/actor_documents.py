@@ -0,0 +1,94 @@
+"""
+    A cache of the serialized actor documents of local actors.
+
+    Remote servers fetch actor documents all the time, and building one means reading and parsing ``actor.json``, reading the public key and reversing several URLs.
+    The serialized document is kept in memory in each process and in Django's cache, so it can be shared between processes.
+
+    A cached document is used only while the modification times of the actor's ``actor.json`` and public key files are unchanged.
+    Calling ``invalidate`` bumps a generation counter in Django's cache, which makes every process rebuild the document.
+"""
+
+from   .caching import LRUCache
+from   collections import namedtuple
+from   django.conf import settings
+from   django.core.cache import cache
+import hashlib
+import json
+
+# How long in seconds to keep an actor document in Django's cache.
+DEFAULT_ACTOR_DOCUMENT_CACHE_TIMEOUT = 24*60*60
+
+ActorDocument = namedtuple('ActorDocument', ['body', 'data', 'etag', 'last_modified'])
+
+def file_modified_time(field_file):
+    if not field_file:
+        return None
+    return field_file.storage.get_modified_time(field_file.name)
+
+class ActorDocumentCache:
+    def __init__(self, maxsize = 1024):
+        self.documents = LRUCache(maxsize = maxsize)
+
+    def generation_key(self, actor):
+        return f'bot:actor-document-generation:{actor.pk}'
+
+    def document_key(self, actor, version):
+        return f'bot:actor-document:{actor.pk}:' + ':'.join(str(v) for v in version)
+
+    def get_version(self, actor):
+        """
+            Everything that a cached document depends on: the modification times of the actor's files, and the generation counter.
+        """
+        json_mtime = file_modified_time(actor.actor_json_file)
+        key_mtime = file_modified_time(actor.public_key_file)
+        generation = cache.get(self.generation_key(actor), 0)
+
+        return (
+            json_mtime.timestamp() if json_mtime else None,
+            key_mtime.timestamp() if key_mtime else None,
+            generation,
+        )
+
+    def build(self, actor, version):
+        data = actor.actor_json()
+        body = json.dumps(data).encode('utf-8')
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        last_modified = max((int(t) for t in version[:2] if t is not None), default = None)
+
+        return ActorDocument(body, data, etag, last_modified)
+
+    def get(self, actor):
+        """
+            The actor's document, built if there isn't an up-to-date copy in either cache.
+        """
+        version = self.get_version(actor)
+
+        cached = self.documents.get(actor.pk)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        key = self.document_key(actor, version)
+        shared = cache.get(key)
+        if shared is not None:
+            body, etag, last_modified = shared
+            document = ActorDocument(body, json.loads(body), etag, last_modified)
+        else:
+            document = self.build(actor, version)
+            timeout = getattr(settings, 'ACTOR_DOCUMENT_CACHE_TIMEOUT', DEFAULT_ACTOR_DOCUMENT_CACHE_TIMEOUT)
+            cache.set(key, (document.body, document.etag, document.last_modified), timeout)
+
+        self.documents.set(actor.pk, (version, document))
+
+        return document
+
+    def invalidate(self, actor):
+        self.documents.delete(actor.pk)
+
+        key = self.generation_key(actor)
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+actor_documents = ActorDocumentCache()
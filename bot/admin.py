@@ -3,7 +3,7 @@ from django.contrib import admin
 from django.template.response import TemplateResponse
 from django.urls import path
 from django.views import generic
-from .models import LocalActor, Note
+from .models import LocalActor, Note, Delivery, DeliveryHost, InboundActivity
 
 # Register your models here.
 class LocalActorAdmin(admin.ModelAdmin):
@@ -87,3 +87,18 @@ class NoteAdmin(admin.ModelAdmin):
         ]
         return my_urls + urls
 admin.site.register(Note, NoteAdmin)
+
+class DeliveryAdmin(admin.ModelAdmin):
+    list_display = ['activity', 'inbox_url', 'status', 'attempts', 'next_attempt_at', 'last_error']
+    list_filter = ['status']
+    search_fields = ['inbox_url', 'domain']
+admin.site.register(Delivery, DeliveryAdmin)
+
+class DeliveryHostAdmin(admin.ModelAdmin):
+    list_display = ['domain', 'consecutive_failures', 'paused_until', 'last_failure_at']
+    search_fields = ['domain']
+admin.site.register(DeliveryHost, DeliveryHostAdmin)
+
+class InboundActivityAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'received_at', 'failed_at', 'error']
+admin.site.register(InboundActivity, InboundActivityAdmin)
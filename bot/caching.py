@@ -0,0 +1,94 @@
+"""
+    Small in-process caches, shared between the threads of one process.
+"""
+
+from   collections import OrderedDict
+import threading
+import time
+
+class LRUCache:
+    """
+        A mapping which holds at most ``maxsize`` items, discarding the least recently used item when it's full.
+
+        If ``ttl`` is given, items expire that many seconds after they were set.
+    """
+
+    def __init__(self, maxsize = 1024, ttl = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default = None):
+        with self.lock:
+            try:
+                value, expires = self.items[key]
+            except KeyError:
+                return default
+
+            if expires is not None and expires < time.monotonic():
+                del self.items[key]
+                return default
+
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+
+        with self.lock:
+            self.items[key] = (value, expires)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last = False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
+
+class SingleFlight:
+    """
+        Makes concurrent calls for the same key share a single call of the function, so that simultaneous lookups of the same thing only do the work once.
+    """
+
+    class Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = SingleFlight.Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
@@ -0,0 +1,80 @@
+"""
+    Spotting activities which have been received before.
+
+    Remote servers often deliver the same activity more than once: when they retry a delivery, or when they send it to both a shared inbox and a personal inbox.
+"""
+
+from   .caching import LRUCache
+from   datetime import timedelta
+from   django.db import IntegrityError, transaction
+from   django.utils.timezone import now
+import hashlib
+
+# How long in seconds to remember an activity for.
+DEFAULT_TTL = 24*60*60
+
+class ActivityDeduplicator:
+    """
+        Remembers which activities each local actor has received, by the activity's ``id``.
+
+        Recently-seen activities are remembered in memory.
+        Every activity is also recorded in the database, so that duplicates are spotted even when they arrive at different worker processes.
+    """
+
+    def __init__(self, maxsize = 10000, ttl = DEFAULT_TTL):
+        self.ttl = ttl
+        self.recent = LRUCache(maxsize = maxsize, ttl = ttl)
+
+    def activity_key(self, recipient, activity_id):
+        return hashlib.sha256(f'{recipient.pk} {activity_id}'.encode('utf-8')).hexdigest()
+
+    def is_duplicate(self, recipient, activity):
+        """
+            Has this activity been received by this actor before?
+
+            If not, it's remembered, so the next time it's received it's a duplicate.
+            Activities without an ``id`` are never considered duplicates.
+        """
+        from .models import SeenActivity
+
+        activity_id = activity.get('id')
+        if not activity_id:
+            return False
+
+        key = self.activity_key(recipient, activity_id)
+
+        if self.recent.get(key):
+            return True
+
+        self.recent.set(key, True)
+
+        try:
+            with transaction.atomic():
+                SeenActivity.objects.create(key = key)
+        except IntegrityError:
+            time = now()
+            expired = SeenActivity.objects.filter(key = key, seen_at__lt = time - timedelta(seconds = self.ttl)).update(seen_at = time)
+            return not expired
+
+        return False
+
+    def forget(self, recipient, activity):
+        """
+            Forget that this activity was received, so that it isn't treated as a duplicate when it's sent again.
+            Call this when storing or handling the activity fails, so that the sender's retry is accepted.
+        """
+        from .models import SeenActivity
+
+        activity_id = activity.get('id')
+        if not activity_id:
+            return
+
+        key = self.activity_key(recipient, activity_id)
+        self.recent.delete(key)
+        SeenActivity.objects.filter(key = key).delete()
+
+    def delete_expired(self):
+        from .models import SeenActivity
+        SeenActivity.objects.filter(seen_at__lt = now() - timedelta(seconds = self.ttl)).delete()
+
+deduplicator = ActivityDeduplicator()
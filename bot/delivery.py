@@ -0,0 +1,141 @@
+"""
+    Pooled HTTP connections for delivering messages to remote servers, and the policy for retrying failed deliveries.
+
+    Connections are kept alive and reused between deliveries, so that messages sent to the same server one after another don't each pay for a DNS lookup, TCP connect and TLS handshake.
+
+    A failed delivery is retried with exponential backoff.
+    A host that fails too many deliveries in a row is paused: nothing is sent to it until the pause ends, and then a single delivery is tried as a probe before the host is used normally again.
+"""
+
+from   django.conf import settings
+import requests
+from   requests.adapters import HTTPAdapter
+import threading
+from   urllib.parse import urlparse
+
+# Timeouts in seconds for connecting to a remote server and for waiting for its response.
+DEFAULT_TIMEOUT = (10, 30)
+
+# The maximum number of simultaneous connections to each remote host, per process.
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 4
+
+# The number of remote hosts to keep open connections to.
+DEFAULT_POOL_HOSTS = 100
+
+# The number of times to try a delivery before giving up.
+DEFAULT_MAX_ATTEMPTS = 10
+
+# The delay in seconds before the first retry of a failed delivery. The delay doubles after each failure, up to the maximum.
+DEFAULT_RETRY_BASE_DELAY = 60
+DEFAULT_RETRY_MAX_DELAY = 6*60*60
+
+# The number of consecutive failed deliveries after which a host is paused.
+DEFAULT_HOST_FAILURE_THRESHOLD = 5
+
+# How long in seconds to pause a failing host for. The pause doubles each time a probe fails, up to the maximum.
+DEFAULT_HOST_PAUSE = 60*60
+DEFAULT_HOST_MAX_PAUSE = 7*24*60*60
+
+# The maximum number of due deliveries to queue each minute.
+DEFAULT_RETRY_BATCH_SIZE = 500
+
+# How long in seconds a delivery may be queued or running before the scheduler assumes it was lost and queues it again.
+DEFAULT_LEASE = 15*60
+
+def delivery_setting(name):
+    """
+        Get a delivery setting, falling back to the default defined in this module.
+        ``name`` is the name of the setting without the ``DELIVERY_`` prefix.
+    """
+    return getattr(settings, 'DELIVERY_' + name, globals()['DEFAULT_' + name])
+
+def retry_delay(attempts):
+    """
+        The number of seconds to wait before retrying a delivery which has failed ``attempts`` times.
+    """
+    return min(delivery_setting('RETRY_BASE_DELAY') * 2**(attempts - 1), delivery_setting('RETRY_MAX_DELAY'))
+
+def host_pause(consecutive_failures):
+    """
+        The number of seconds to pause a host for after ``consecutive_failures`` failed deliveries in a row.
+    """
+    failed_probes = consecutive_failures - delivery_setting('HOST_FAILURE_THRESHOLD')
+    return min(delivery_setting('HOST_PAUSE') * 2**failed_probes, delivery_setting('HOST_MAX_PAUSE'))
+
+def is_retryable_status(status_code):
+    """
+        Should a delivery which got this HTTP status code be tried again later?
+        Server errors and rate limiting are worth retrying; other client errors won't change.
+    """
+    return status_code >= 500 or status_code in (408, 429)
+
+class DeliveryException(Exception):
+    pass
+
+class DeliveryEngine:
+    """
+        Sends HTTP requests through a shared pool of keep-alive connections.
+
+        Each host gets its own connection pool, and no more than ``max_connections_per_host`` requests to one host run at once.
+        A request that can't get a connection within the connect timeout raises a DeliveryException.
+    """
+
+    def __init__(self, timeout = DEFAULT_TIMEOUT, max_connections_per_host = DEFAULT_MAX_CONNECTIONS_PER_HOST, pool_hosts = DEFAULT_POOL_HOSTS):
+        self.timeout = timeout
+        self.max_connections_per_host = max_connections_per_host
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = pool_hosts, pool_maxsize = max_connections_per_host)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.host_semaphores = {}
+        self.lock = threading.Lock()
+
+    def get_host_semaphore(self, host):
+        with self.lock:
+            semaphore = self.host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = self.host_semaphores[host] = threading.BoundedSemaphore(self.max_connections_per_host)
+            return semaphore
+
+    def connect_timeout(self):
+        return self.timeout[0] if isinstance(self.timeout, tuple) else self.timeout
+
+    def request(self, method, url, **kwargs):
+        host = urlparse(url).netloc
+        kwargs.setdefault('timeout', self.timeout)
+
+        semaphore = self.get_host_semaphore(host)
+        if not semaphore.acquire(timeout = self.connect_timeout()):
+            raise DeliveryException(f'Timed out waiting for a connection to {host}')
+
+        try:
+            return self.session.request(method, url, **kwargs)
+        finally:
+            semaphore.release()
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_delivery_engine():
+    """
+        Get the delivery engine for this process, creating it from the settings the first time it's needed.
+    """
+    global _engine
+
+    with _engine_lock:
+        if _engine is None:
+            _engine = DeliveryEngine(
+                timeout = delivery_setting('TIMEOUT'),
+                max_connections_per_host = delivery_setting('MAX_CONNECTIONS_PER_HOST'),
+                pool_hosts = delivery_setting('POOL_HOSTS'),
+            )
+
+        return _engine
@@ -0,0 +1,106 @@
+"""
+    An asyncio worker which takes tasks off the huey queue and runs many of them at once.
+
+    Delivering a message mostly means waiting for a remote server to respond, so running deliveries one at a time per worker thread lets the slowest server set the pace for everything else.
+    This worker runs up to ``max_in_flight`` tasks at once, and no more than ``max_per_domain`` deliveries to any one domain.
+
+    It runs alongside the normal huey consumer, which is still needed to run scheduled and periodic tasks.
+"""
+
+import asyncio
+from   concurrent.futures import ThreadPoolExecutor
+from   django.db import close_old_connections
+import logging
+import signal
+from   urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = 200
+DEFAULT_MAX_PER_DOMAIN = 4
+DEFAULT_POLL_INTERVAL = 0.5
+
+def task_domain(task):
+    """
+        The domain that a task delivers to, or None if it isn't a delivery task.
+    """
+    from . import tasks
+
+    if isinstance(task, tasks.send_message.task_class):
+        inbox_url = task.args[0]
+        return urlparse(inbox_url).netloc
+
+class DeliveryWorker:
+    def __init__(self, huey, max_in_flight = DEFAULT_MAX_IN_FLIGHT, max_per_domain = DEFAULT_MAX_PER_DOMAIN, poll_interval = DEFAULT_POLL_INTERVAL):
+        self.huey = huey
+        self.max_in_flight = max_in_flight
+        self.max_per_domain = max_per_domain
+        self.poll_interval = poll_interval
+
+        self.domain_semaphores = {}
+        self.running_tasks = set()
+        self.stopping = False
+
+    def stop(self):
+        logger.info('Stopping the delivery worker once in-flight tasks have finished.')
+        self.stopping = True
+
+    def get_domain_semaphore(self, domain):
+        semaphore = self.domain_semaphores.get(domain)
+        if semaphore is None:
+            semaphore = self.domain_semaphores[domain] = asyncio.Semaphore(self.max_per_domain)
+        return semaphore
+
+    def execute(self, task):
+        """
+            Run a task in a worker thread.
+        """
+        close_old_connections()
+        try:
+            self.huey.execute(task)
+        except Exception:
+            logger.exception(f'Error running {task}')
+        finally:
+            close_old_connections()
+
+    async def run_task(self, task):
+        loop = asyncio.get_running_loop()
+        try:
+            domain = task_domain(task)
+            if domain is None:
+                await loop.run_in_executor(None, self.execute, task)
+            else:
+                async with self.get_domain_semaphore(domain):
+                    await loop.run_in_executor(None, self.execute, task)
+        finally:
+            self.in_flight.release()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers = self.max_in_flight))
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+
+        while not self.stopping:
+            await self.in_flight.acquire()
+
+            try:
+                task = await loop.run_in_executor(None, self.huey.dequeue)
+            except Exception:
+                logger.exception('Error reading from the task queue')
+                task = None
+
+            if task is None:
+                self.in_flight.release()
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            running_task = asyncio.create_task(self.run_task(task))
+            self.running_tasks.add(running_task)
+            running_task.add_done_callback(self.running_tasks.discard)
+
+        if self.running_tasks:
+            await asyncio.gather(*self.running_tasks)
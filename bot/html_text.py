@@ -0,0 +1,49 @@
+"""
+    Extracting the plain text from a fragment of HTML, such as the content of a note.
+"""
+
+from   html.parser import HTMLParser
+
+class TextExtractor(HTMLParser):
+    """
+        Collects the text in a fragment of HTML, ignoring the tags.
+
+        Once more than ``max_length`` characters have been collected, ``done`` is set and the rest of the input can be skipped.
+    """
+
+    def __init__(self, max_length = None):
+        super().__init__(convert_charrefs = True)
+        self.max_length = max_length
+        self.parts = []
+        self.length = 0
+        self.done = False
+
+    def handle_data(self, data):
+        if self.done:
+            return
+        self.parts.append(data)
+        self.length += len(data)
+        if self.max_length is not None and self.length > self.max_length:
+            self.done = True
+
+    def text(self):
+        return ''.join(self.parts)
+
+def html_to_text(html, max_length = None, chunk_size = 4096):
+    """
+        The text in the given HTML. If ``max_length`` is given, the text is cut off after that many characters and ends with an ellipsis.
+
+        The HTML is parsed in chunks, so a long document isn't parsed past the point where there's enough text.
+    """
+    extractor = TextExtractor(max_length = max_length)
+    for start in range(0, len(html), chunk_size):
+        extractor.feed(html[start:start+chunk_size])
+        if extractor.done:
+            break
+    else:
+        extractor.close()
+
+    text = extractor.text()
+    if max_length is not None and len(text) > max_length:
+        text = text[:max_length-1] + '…'
+    return text
@@ -0,0 +1,94 @@
+"""
+    Checking the HTTP signatures on requests sent to inboxes.
+"""
+
+from   .keys import remote_public_keys
+from   .send_signed_message import HttpSignature, content_digest_sha256, parse_signature_header
+from   datetime import datetime, timedelta, timezone
+from   django.conf import settings
+import email.utils
+
+# The headers which must be covered by the signature on a POST request.
+REQUIRED_HEADERS = {'(request-target)', 'host', 'date', 'digest'}
+
+# How far in seconds the Date header of a signed request may be from the current time.
+DEFAULT_SIGNATURE_MAX_AGE = 12*60*60
+
+class SignatureException(Exception):
+    pass
+
+def check_date(date_header):
+    if date_header is None:
+        raise SignatureException('The request has no Date header')
+
+    try:
+        date = email.utils.parsedate_to_datetime(date_header)
+    except (TypeError, ValueError):
+        raise SignatureException(f'Could not parse the Date header: {date_header}')
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo = timezone.utc)
+
+    max_age = timedelta(seconds = getattr(settings, 'SIGNATURE_MAX_AGE', DEFAULT_SIGNATURE_MAX_AGE))
+    if abs(datetime.now(timezone.utc) - date) > max_age:
+        raise SignatureException('The Date header is too far from the current time')
+
+def check_digest(digest_header, body):
+    if digest_header is None:
+        raise SignatureException('The request has no Digest header')
+
+    expected = content_digest_sha256(body).split('=', 1)[1]
+
+    for digest in digest_header.split(','):
+        algorithm, _, value = digest.strip().partition('=')
+        if algorithm.upper() == 'SHA-256' and value == expected:
+            return
+
+    raise SignatureException('The Digest header does not match the body')
+
+def verify_request(request):
+    """
+        Check the HTTP signature on a POST request.
+
+        Returns the URL of the actor who owns the key the request was signed with.
+        Raises a SignatureException if the signature is missing or doesn't verify.
+    """
+    signature_header = request.headers.get('Signature')
+    if signature_header is None:
+        raise SignatureException('The request is not signed')
+
+    params = parse_signature_header(signature_header)
+    key_id = params.get('keyId')
+    signature = params.get('signature')
+    if not key_id or not signature:
+        raise SignatureException('The Signature header is missing the keyId or signature')
+
+    algorithm = params.get('algorithm', 'hs2019')
+    if algorithm not in ('rsa-sha256', 'hs2019'):
+        raise SignatureException(f'Unsupported signature algorithm: {algorithm}')
+
+    header_names = params.get('headers', 'date').lower().split()
+    missing = REQUIRED_HEADERS - set(header_names)
+    if missing:
+        raise SignatureException(f'The signature does not cover the headers: {", ".join(sorted(missing))}')
+
+    check_date(request.headers.get('Date'))
+    check_digest(request.headers.get('Digest'), request.body)
+
+    http_signature = HttpSignature()
+    for name in header_names:
+        if name == '(request-target)':
+            value = f'{request.method.lower()} {request.get_full_path()}'
+        else:
+            value = request.headers.get(name)
+            if value is None:
+                raise SignatureException(f'The signed header {name} is missing')
+        http_signature.with_field(name, value)
+
+    public_key = remote_public_keys.get(key_id)
+    if public_key is None or not http_signature.verify(public_key.key, signature):
+        public_key = remote_public_keys.refresh(key_id)
+        if public_key is None or not http_signature.verify(public_key.key, signature):
+            raise SignatureException(f'The signature could not be verified with the key {key_id}')
+
+    return public_key.owner
@@ -1,8 +1,11 @@
 from   . import activitystreams
 from   . import tasks
 from   .absolute_url import absolute_reverse
+from   .caching import LRUCache
 from   django.conf import settings
+import functools
 import json
+import threading
 import uuid
 
 class InboxException(Exception):
@@ -12,17 +15,36 @@ class AbstractInboxHandler:
     def __init__(self, actor):
         self.actor = actor
 
+    @classmethod
+    @functools.lru_cache(maxsize = 1024)
+    def get_handler_method(cls, activity_type):
+        """
+            The method of this class which handles activities of the given type, or None.
+        """
+        return getattr(cls, 'handle_'+activity_type, None)
+
+    @classmethod
+    def can_handle(cls, activity_type):
+        """
+            Might this class handle activities of the given type?
+            Classes which override ``handle`` might handle anything.
+        """
+        if cls.handle is not AbstractInboxHandler.handle:
+            return True
+        return cls.get_handler_method(activity_type) is not None
+
     def handle(self, activity):
         activity_type = activity.get('type')
         if activity_type is None:
             raise InboxException('This request is missing the type field')
+        if not isinstance(activity_type, str):
+            raise InboxException(f'Unrecognised activity type: {activity_type}')
 
-        try:
-            handler = getattr(self,'handle_'+activity_type)
-        except AttributeError:
+        handler = self.get_handler_method(activity_type)
+        if handler is None:
             raise InboxException(f'Unrecognised activity type: {activity_type}')
 
-        response = handler(activity)
+        response = handler(self, activity)
 
         if response is None:
             response = {}
@@ -46,7 +68,7 @@ class AbstractInboxHandler:
             :param: activity - JSON for a Create activity.
         """
 
-        tasks.save_mention(self.actor, activity)
+        tasks.save_mention(self.actor.pk, activity)
 
 class InboxHandler(AbstractInboxHandler):
     """
@@ -59,7 +81,7 @@ class InboxHandler(AbstractInboxHandler):
         except KeyError:
             raise Exception('This request is missing the actor field')
 
-        tasks.add_follower(self.actor, follower, self.accept_message(activity))
+        tasks.add_follower(self.actor.pk, follower, self.accept_message(activity))
 
         return {'ok': True}
 
@@ -75,21 +97,21 @@ class InboxHandler(AbstractInboxHandler):
 
     def handle_undo_Follow(self, activity):
         follower = activity['actor']
-        tasks.remove_follower(self.actor, follower)
+        tasks.remove_follower(self.actor.pk, follower)
 
         return {'ok': True}
 
     def handle_Like(self, activity):
-        tasks.add_like(self.actor, activity)
+        tasks.add_like(self.actor.pk, activity)
 
     def handle_undo_Like(self, activity):
-        tasks.remove_like(self.actor, activity)
+        tasks.remove_like(self.actor.pk, activity)
 
     def handle_Announce(self, activity):
-        tasks.add_announce(self.actor, activity)
+        tasks.add_announce(self.actor.pk, activity)
 
     def handle_undo_Announce(self, activity):
-        tasks.remove_announce(self.actor, activity)
+        tasks.remove_announce(self.actor.pk, activity)
 
     @activitystreams.with_context([activitystreams.ACTIVITYSTREAMS_CONTEXT, activitystreams.SECURITY_CONTEXT])
     def accept_message(self, activity):
@@ -99,30 +121,109 @@ class InboxHandler(AbstractInboxHandler):
             'object': activity,
         })
 
+class InboxHandlerRegistry:
+    """
+        The registered inbox handler classes, and an index of which of them apply to each actor and activity type.
+
+        The index is filled in as activities are received, and cleared when a handler is registered.
+        Handler instances are reused for each actor, and given the actor object they're handling an activity for, so they never hold a stale copy of it.
+    """
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.index = LRUCache(maxsize = 4096)
+        self.instances = LRUCache(maxsize = 1024)
+        self.lock = threading.Lock()
+
+    def register(self, handler_cls, spec = None):
+        with self.lock:
+            self.handlers.append((handler_cls, spec))
+            self.index.clear()
+            self.instances.clear()
+
+    def compile(self, domain, username, activity_type):
+        """
+            The handler classes which might handle an activity of the given type, received by the given actor.
+
+            Returns a list of pairs ``(handler_cls, spec)``, where ``spec`` is a callable which still has to be checked for each activity, or None.
+        """
+        entries = []
+
+        for handler_cls, spec in self.handlers:
+            if not handler_cls.can_handle(activity_type):
+                continue
+
+            if spec is None:
+                entries.append((handler_cls, None))
+            elif callable(spec):
+                entries.append((handler_cls, spec))
+            elif spec.get('username', username) == username and spec.get('domain', domain) == domain:
+                entries.append((handler_cls, None))
+
+        return entries
+
+    def get_entries(self, actor, activity_type):
+        key = (actor.domain, actor.username, activity_type)
+        entries = self.index.get(key)
+        if entries is None:
+            entries = self.compile(actor.domain, actor.username, activity_type)
+            self.index.set(key, entries)
+        return entries
+
+    def get_instance(self, handler_cls, actor):
+        key = (handler_cls, actor.pk)
+        instance = self.instances.get(key)
+        if instance is None:
+            instance = handler_cls(actor)
+            self.instances.set(key, instance)
+        else:
+            instance.actor = actor
+        return instance
+
+    def get_handlers(self, actor, activity):
+        activity_type = activity.get('type')
+        if not isinstance(activity_type, str):
+            return
+
+        for handler_cls, spec in self.get_entries(actor, activity_type):
+            if spec is None or spec(actor, activity):
+                yield self.get_instance(handler_cls, actor)
+
 inbox_handlers = [
     (InboxHandler, {}),
 ]
 
+registry = InboxHandlerRegistry(inbox_handlers)
+
 def register_inbox_handler(handler_cls, spec = None):
     """
         Register an inbox handler class.
 
         :param: spec - A dict with any of the keys 'username' or 'domain', specifying which actors this class should be used for, or a callable given parameters 'actor' and 'activity'.
     """
-    inbox_handlers.append((handler_cls, spec))
+    registry.register(handler_cls, spec)
 
 def get_inbox_handlers(actor, activity):
     """
         A generator which yields all registered inbox handler classes which should handle the given activity for the given actor.
     """
+    return registry.get_handlers(actor, activity)
 
-    for handler_cls, spec in inbox_handlers:
-        if spec is None:
-            use = True
-        elif callable(spec):
-            use = spec(actor, activity)
-        else:
-            use = spec.get('username', actor.username) == actor.username and spec.get('domain', actor.domain) == actor.domain
+def handle_activity(actor, activity):
+    """
+        Run all the inbox handlers which should handle the given activity received by the given actor.
+
+        Returns the last non-empty result from a handler, or None.
+    """
+    result = None
+
+    for inbox_handler in get_inbox_handlers(actor, activity):
+        try:
+            hresult = inbox_handler.handle(activity)
+            if hresult is not None:
+                result = hresult
+
+        except InboxException as e:
+            pass
 
-        if use:
-            yield handler_cls(actor)
+    return result
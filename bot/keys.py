@@ -0,0 +1,113 @@
+"""
+    Caches of parsed cryptographic keys.
+
+    Parsing and validating a PEM-encoded RSA key takes a few milliseconds, which adds up when one message is signed for thousands of recipients.
+"""
+
+from   .caching import LRUCache
+from   collections import namedtuple
+from   cryptography.hazmat.primitives.asymmetric import rsa
+from   cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+import logging
+from   urllib.parse import urldefrag
+
+logger = logging.getLogger(__name__)
+
+class PrivateKeyCache:
+    """
+        Holds the parsed private keys of local actors, keyed by the actor's ID.
+
+        The modification time of the key file is checked on each lookup, so a rotated key is picked up straight away.
+    """
+
+    def __init__(self, maxsize = 128):
+        self.cache = LRUCache(maxsize = maxsize)
+
+    def get(self, actor):
+        key_file = actor.private_key_file
+        mtime = key_file.storage.get_modified_time(key_file.name)
+
+        cached = self.cache.get(actor.pk)
+        if cached is not None:
+            cached_mtime, private_key = cached
+            if cached_mtime == mtime:
+                return private_key
+
+        private_key = load_pem_private_key(actor.get_private_key(), password = None)
+        self.cache.set(actor.pk, (mtime, private_key))
+
+        return private_key
+
+    def invalidate(self, actor):
+        self.cache.delete(actor.pk)
+
+private_keys = PrivateKeyCache()
+
+RemotePublicKey = namedtuple('RemotePublicKey', ['key', 'owner'])
+
+class RemotePublicKeyCache:
+    """
+        Holds the parsed public keys of remote actors, keyed by ``keyId``, for checking the signatures on requests they send.
+
+        Keys are loaded from the stored profile of the remote actor who owns them, and the actor is fetched if it isn't known yet.
+        Cached keys are reloaded from the stored profile once they're ``ttl`` seconds old.
+
+        When a signature doesn't verify, ``refresh`` fetches the actor's profile again in case the key has been rotated.
+        A key is refetched at most once every ``refetch_interval`` seconds, so forged requests can't make us fetch a profile on every request.
+    """
+
+    def __init__(self, maxsize = 4096, ttl = 60*60, refetch_interval = 60):
+        self.cache = LRUCache(maxsize = maxsize, ttl = ttl)
+        self.recently_refetched = LRUCache(maxsize = maxsize, ttl = refetch_interval)
+
+    def get(self, key_id):
+        public_key = self.cache.get(key_id)
+        if public_key is None:
+            public_key = self.load(key_id, refetch = False)
+        return public_key
+
+    def refresh(self, key_id):
+        if self.recently_refetched.get(key_id):
+            return None
+
+        self.recently_refetched.set(key_id, True)
+        return self.load(key_id, refetch = True)
+
+    def load(self, key_id, refetch):
+        from .models import RemoteActor
+
+        actor_url = urldefrag(key_id).url
+
+        try:
+            if refetch:
+                remote_actor = RemoteActor.objects.refetch_by_url(actor_url)
+            else:
+                remote_actor = RemoteActor.objects.get_by_url(actor_url)
+        except Exception:
+            logger.exception(f'Could not load the actor for the key {key_id}')
+            return None
+
+        if remote_actor.get_public_key_url() != key_id:
+            return None
+
+        pem = remote_actor.get_public_key()
+        if pem is None:
+            return None
+
+        try:
+            key = load_pem_public_key(pem)
+        except ValueError:
+            return None
+
+        if not isinstance(key, rsa.RSAPublicKey):
+            return None
+
+        public_key = RemotePublicKey(key = key, owner = remote_actor.get_absolute_url())
+        self.cache.set(key_id, public_key)
+
+        return public_key
+
+    def invalidate(self, key_id):
+        self.cache.delete(key_id)
+
+remote_public_keys = RemotePublicKeyCache()
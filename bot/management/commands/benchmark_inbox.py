@@ -0,0 +1,101 @@
+from   bot.models import LocalActor
+from   concurrent.futures import ThreadPoolExecutor
+from   django.conf import settings
+from   django.core.management.base import BaseCommand
+from   django.db import connection, connections
+from   django.test import Client, override_settings
+from   huey.contrib.djhuey import HUEY
+from   huey.storage import MemoryStorage
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+BENCHMARK_URL = 'https://benchmark.invalid/'
+
+class Command(BaseCommand):
+    help = "Measure how many activities per second an inbox can accept, with several clients posting at once. The benchmark runs against a throwaway database on the configured server, which is deleted afterwards."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--domain', help='The domain to post to. Defaults to the first of DOMAINS.')
+        parser.add_argument('--requests', type=int, default=2000, help='The number of activities to post.')
+        parser.add_argument('--concurrency', type=int, default=8, help='The number of clients posting at once.')
+
+    def handle(self, *args, **options):
+        domain = options['domain'] or settings.DOMAINS[0]
+
+        # Django's test database for SQLite is kept in memory: use a file instead, so that the benchmark measures writing to disk.
+        tmpdir = None
+        test_settings = connection.settings_dict['TEST']
+        if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            tmpdir = tempfile.TemporaryDirectory()
+            test_settings['NAME'] = os.path.join(tmpdir.name, 'benchmark.sqlite3')
+
+        old_name = connection.settings_dict['NAME']
+        self.stdout.write('Creating a throwaway database...')
+        connection.creation.create_test_db(verbosity = 0, autoclobber = True, serialize = False)
+
+        # Tasks are queued in memory and never run, so the task runner doesn't see the benchmark's activities.
+        immediate, storage = HUEY.immediate, HUEY.storage
+        HUEY.immediate = False
+        HUEY.storage = MemoryStorage(HUEY.name)
+
+        try:
+            self.run_benchmark(domain, options['requests'], options['concurrency'])
+        finally:
+            HUEY.immediate = immediate
+            HUEY.storage = storage
+            connection.creation.destroy_test_db(old_name, verbosity = 0)
+            if tmpdir is not None:
+                tmpdir.cleanup()
+
+    def run_benchmark(self, domain, num_requests, concurrency):
+        self.actor = LocalActor.objects.create(username = 'benchmark', domain = domain)
+        self.inbox_path = self.actor.get_inbox_url().split(domain, 1)[1]
+        self.local = threading.local()
+
+        self.stdout.write(f'Posting {num_requests} activities to {self.inbox_path} on {connection.vendor}, {concurrency} at a time...')
+
+        # Signatures aren't checked, so the benchmark measures the database writes rather than RSA.
+        # Activities are stored and queued for the task runner, as they are by default.
+        with override_settings(VERIFY_INBOX_SIGNATURES = False, ASYNC_INBOX = True):
+            with ThreadPoolExecutor(max_workers = concurrency) as executor:
+                t = time.perf_counter()
+                timings = list(executor.map(self.post_activity, range(num_requests)))
+                elapsed = time.perf_counter() - t
+
+                # Close each client thread's database connection, so the throwaway database can be deleted.
+                barrier = threading.Barrier(concurrency)
+                list(executor.map(self.close_connections, [barrier] * concurrency))
+
+        statuses = {}
+        for status, duration in timings:
+            statuses[status] = statuses.get(status, 0) + 1
+        durations = sorted(duration for status, duration in timings)
+
+        self.stdout.write(f'{num_requests / elapsed:.1f} activities per second')
+        self.stdout.write(f'median {durations[len(durations)//2]*1000:.1f}ms, 99th percentile {durations[int(len(durations)*0.99)]*1000:.1f}ms')
+        self.stdout.write(f'responses: {statuses}')
+
+    def close_connections(self, barrier):
+        barrier.wait()
+        connections.close_all()
+
+    def post_activity(self, i):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client()
+
+        activity = {
+            '@context': 'https://www.w3.org/ns/activitystreams',
+            'id': f'{BENCHMARK_URL}activities/{uuid.uuid4()}',
+            'type': 'Like',
+            'actor': f'{BENCHMARK_URL}users/benchmark',
+            'object': self.actor.get_absolute_url(),
+        }
+
+        t = time.perf_counter()
+        response = client.post(self.inbox_path, json.dumps(activity), content_type = 'application/activity+json', HTTP_HOST = self.actor.domain)
+        return response.status_code, time.perf_counter() - t
@@ -0,0 +1,121 @@
+from   bot.models import Follower, LocalActor, Note, RemoteActor
+from   django.core.management.base import BaseCommand
+from   django.db import transaction
+from   django.db.models import Q
+from   django.utils.timezone import now
+import time
+
+BENCHMARK_DOMAIN = 'benchmark.invalid'
+
+class Command(BaseCommand):
+    help = 'Seed the database with benchmark data, then show the query plans and timings of the most frequent lookups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notes', type=int, default=1_000_000, help='The number of notes to create.')
+        parser.add_argument('--remote-actors', type=int, default=100_000, help='The number of remote actors to create.')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=100, help='How many times to run each query when timing it.')
+        parser.add_argument('--no-seed', action='store_true', help="Don't create any data: use what was seeded by an earlier run.")
+        parser.add_argument('--clean', action='store_true', help='Delete the benchmark data and stop.')
+
+    def handle(self, *args, **options):
+        self.options = options
+
+        if options['clean']:
+            self.clean()
+            return
+
+        if not options['no_seed']:
+            self.seed()
+
+        self.explain_queries()
+
+    def clean(self):
+        # Deleting notes normally sends Delete activities to followers, so delete them without running any signal receivers.
+        Note.objects.filter(Q(local_actor__domain = BENCHMARK_DOMAIN) | Q(remote_actor__domain = BENCHMARK_DOMAIN))._raw_delete(Note.objects.db)
+        Follower.objects.filter(following__domain = BENCHMARK_DOMAIN).delete()
+        RemoteActor.objects.filter(domain = BENCHMARK_DOMAIN).delete()
+        LocalActor.objects.filter(domain = BENCHMARK_DOMAIN).delete()
+        self.stdout.write('Deleted the benchmark data.')
+
+    def in_batches(self, model, objects):
+        batch_size = self.options['batch_size']
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) == batch_size:
+                model.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+
+    def seed(self):
+        num_notes = self.options['notes']
+        num_remote_actors = self.options['remote_actors']
+        start = now()
+
+        self.stdout.write(f'Creating {num_remote_actors} remote actors and {num_notes} notes on {BENCHMARK_DOMAIN}...')
+
+        # Notes, remote actors and followers are created with bulk_create, so no signal receivers run: nothing is rendered or sent.
+        with transaction.atomic():
+            local_actors = [LocalActor.objects.create(username = f'bench{i}', domain = BENCHMARK_DOMAIN) for i in range(10)]
+
+            self.in_batches(RemoteActor, (
+                RemoteActor(
+                    username = f'remote{i}',
+                    domain = BENCHMARK_DOMAIN,
+                    url = f'https://{BENCHMARK_DOMAIN}/users/remote{i}',
+                    profile = {},
+                )
+                for i in range(num_remote_actors)
+            ))
+            remote_actor_pks = list(RemoteActor.objects.filter(domain = BENCHMARK_DOMAIN).values_list('pk', flat = True))
+
+            self.in_batches(Follower, (
+                Follower(remote_actor_id = pk, following = local_actors[i % len(local_actors)])
+                for i, pk in enumerate(remote_actor_pks)
+            ))
+
+            self.in_batches(Note, (
+                Note(
+                    local_actor = local_actors[i % len(local_actors)] if i % 2 == 0 else None,
+                    remote_actor_id = None if i % 2 == 0 else remote_actor_pks[i % len(remote_actor_pks)],
+                    data = {'content': f'Benchmark note {i}'},
+                )
+                for i in range(num_notes)
+            ))
+
+        self.stdout.write(f'Seeded in {(now() - start).total_seconds():.1f}s.')
+
+    def explain_queries(self):
+        local_actor = LocalActor.objects.filter(domain = BENCHMARK_DOMAIN).first()
+        remote_actor = RemoteActor.objects.filter(domain = BENCHMARK_DOMAIN).order_by('-pk').first()
+        if local_actor is None or remote_actor is None:
+            self.stderr.write('There is no benchmark data: run this command without --no-seed first.')
+            return
+
+        middle_note = local_actor.notes.order_by('-published_date', '-pk')[100]
+
+        queries = {
+            'Remote actor by URL': RemoteActor.objects.filter(url = remote_actor.url),
+            'Remote actor by username and domain': RemoteActor.objects.filter(username = remote_actor.username, domain = remote_actor.domain),
+            'Local actor by username and domain': LocalActor.objects.filter(username = local_actor.username, domain = local_actor.domain),
+            'First page of the outbox': local_actor.notes.order_by('-published_date', '-pk')[:21],
+            'Later page of the outbox': local_actor.notes.filter(
+                Q(published_date__lt = middle_note.published_date) | Q(published_date = middle_note.published_date, pk__lt = middle_note.pk)
+            ).order_by('-published_date', '-pk')[:21],
+            "A remote actor's notes": remote_actor.notes.order_by('-published_date', '-pk')[:21],
+            'First page of followers': local_actor.follow_relations.order_by('-follow_date', '-pk')[:21],
+        }
+
+        for name, queryset in queries.items():
+            timings = []
+            for i in range(self.options['repeat']):
+                t = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - t)
+            timings.sort()
+
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain())
+            self.stdout.write(f'median {timings[len(timings)//2]*1000:.2f}ms, max {timings[-1]*1000:.2f}ms\n\n')
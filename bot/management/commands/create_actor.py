@@ -1,5 +1,6 @@
 from   bot.models import LocalActor, AccessToken
 from   django.conf import settings
+from   django.core.exceptions import ValidationError
 from   django.core.management.base import BaseCommand, CommandError
 import json
 import uuid
@@ -19,9 +20,15 @@ class Command(BaseCommand):
         domain = settings.DOMAINS[int(rdomain)]
         username = input("Username: ")
 
+        a = LocalActor(username = username, domain = domain)
+        try:
+            a.clean()
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+
         print(f"The actor will be @{username}@{domain}")
 
-        a = LocalActor.objects.create(username = username, domain = domain)
+        a.save()
         a.fill_in_bits()
 
         if input("Create an API access token? ").lower().strip() == 'y':
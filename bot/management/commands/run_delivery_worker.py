@@ -0,0 +1,21 @@
+from   bot.delivery_worker import DeliveryWorker, DEFAULT_MAX_IN_FLIGHT, DEFAULT_MAX_PER_DOMAIN
+from   django.conf import settings
+from   django.core.management.base import BaseCommand
+from   huey.contrib.djhuey import HUEY
+import asyncio
+
+class Command(BaseCommand):
+    help = 'Run queued tasks concurrently, with limits on the number of deliveries in flight overall and to each domain'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-in-flight', type=int, default=getattr(settings, 'DELIVERY_WORKER_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT))
+        parser.add_argument('--max-per-domain', type=int, default=getattr(settings, 'DELIVERY_WORKER_MAX_PER_DOMAIN', DEFAULT_MAX_PER_DOMAIN))
+
+    def handle(self, *args, **options):
+        worker = DeliveryWorker(
+            HUEY,
+            max_in_flight = options['max_in_flight'],
+            max_per_domain = options['max_per_domain'],
+        )
+
+        asyncio.run(worker.run())
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='remoteactor',
+            name='following',
+            field=models.ManyToManyField(related_name='followers', through='bot.Follower', through_fields=('remote_actor', 'following'), to='bot.localactor'),
+        ),
+        migrations.CreateModel(
+            name='OutgoingActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('body', models.BinaryField()),
+                ('digest', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outgoing_activities', to='bot.localactor')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0003_delivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboundActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('queued_at', models.DateTimeField(auto_now_add=True)),
+                ('failed_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbound_activities', to='bot.localactor')),
+            ],
+            options={
+                'verbose_name_plural': 'inbound activities',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0004_inboundactivity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeenActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('seen_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0006_remoteactor_fetched_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='localactor',
+            name='followers_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
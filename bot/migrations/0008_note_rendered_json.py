@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:10
+
+from bot import activitystreams
+from bot.absolute_url import absolute_reverse
+from django.db import migrations, models
+import json
+
+
+def note_url(note):
+    if note.local_actor:
+        return absolute_reverse('note', username=note.local_actor.username, domain=note.local_actor.domain, uid=str(note.uid))
+
+
+def build_note_json(note):
+    """
+        The same as Note.build_note_json when this migration was written.
+    """
+    data = note.data.copy()
+
+    if note.local_actor:
+        data.update({
+            'published': activitystreams.format_datetime(note.published_date),
+            'attributedTo': absolute_reverse('user_profile', username=note.local_actor.username, domain=note.local_actor.domain),
+            'id': note_url(note),
+            'type': 'Note',
+            'to': [activitystreams.PUBLIC] if note.public else [r.url for r in note.to.all()]
+        })
+        if note.in_reply_to:
+            data['inReplyTo'] = note_url(note.in_reply_to)
+
+    return activitystreams.add_context(data)
+
+
+def render_notes(apps, schema_editor):
+    Note = apps.get_model('bot', 'Note')
+
+    notes = []
+    for note in Note.objects.select_related('local_actor', 'in_reply_to__local_actor').prefetch_related('to').iterator(chunk_size = 1000):
+        note.rendered_json = json.dumps(build_note_json(note))
+        notes.append(note)
+        if len(notes) == 1000:
+            Note.objects.bulk_update(notes, ['rendered_json'])
+            notes = []
+    Note.objects.bulk_update(notes, ['rendered_json'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0007_localactor_followers_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='rendered_json',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(render_notes, migrations.RunPython.noop),
+    ]
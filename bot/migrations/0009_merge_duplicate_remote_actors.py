@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:11
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def merge_duplicate_remote_actors(apps, schema_editor):
+    """
+        Before RemoteActor.url is made unique, merge remote actors which share a URL into the oldest of them.
+        Relations pointing at the duplicates are moved to the actor that's kept, skipping any that it already has.
+    """
+    RemoteActor = apps.get_model('bot', 'RemoteActor')
+    Follower = apps.get_model('bot', 'Follower')
+    Note = apps.get_model('bot', 'Note')
+
+    duplicate_urls = RemoteActor.objects.values('url').annotate(n = Count('pk')).filter(n__gt = 1).values_list('url', flat = True)
+
+    for url in list(duplicate_urls):
+        keep, *duplicates = RemoteActor.objects.filter(url = url).order_by('pk')
+        duplicate_pks = [actor.pk for actor in duplicates]
+
+        following = set(Follower.objects.filter(remote_actor = keep).values_list('following_id', flat = True))
+        for follower in Follower.objects.filter(remote_actor_id__in = duplicate_pks):
+            if follower.following_id in following:
+                follower.delete()
+            else:
+                follower.remote_actor = keep
+                follower.save()
+                following.add(follower.following_id)
+
+        Note.objects.filter(remote_actor_id__in = duplicate_pks).update(remote_actor = keep)
+
+        for field in ('to', 'likes', 'announces'):
+            through = getattr(Note, field).through
+            notes = set(through.objects.filter(remoteactor = keep).values_list('note_id', flat = True))
+            for row in through.objects.filter(remoteactor_id__in = duplicate_pks):
+                if row.note_id in notes:
+                    row.delete()
+                else:
+                    row.remoteactor = keep
+                    row.save()
+                    notes.add(row.note_id)
+
+        RemoteActor.objects.filter(pk__in = duplicate_pks).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0008_note_rendered_json'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_remote_actors, migrations.RunPython.noop),
+    ]
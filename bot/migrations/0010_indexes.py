@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0009_merge_duplicate_remote_actors'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='remoteactor',
+            name='url',
+            field=models.URLField(max_length=500, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='follower',
+            index=models.Index(fields=['following', '-follow_date', '-id'], name='follower_by_date'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['local_actor', '-published_date', '-uid'], name='note_local_actor_by_date'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['remote_actor', '-published_date', '-uid'], name='note_remote_actor_by_date'),
+        ),
+        migrations.AddIndex(
+            model_name='remoteactor',
+            index=models.Index(fields=['username', 'domain'], name='remote_actor_handle'),
+        ),
+        migrations.AddConstraint(
+            model_name='localactor',
+            constraint=models.UniqueConstraint(fields=('username', 'domain'), name='unique_local_actor'),
+        ),
+    ]
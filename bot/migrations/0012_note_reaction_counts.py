@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:16
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_reactions(apps, schema_editor):
+    Note = apps.get_model('bot', 'Note')
+
+    def reaction_count(relation):
+        through = relation.through
+        count = through.objects.filter(note = models.OuterRef('pk')).order_by().values('note').annotate(n = models.Count('*')).values('n')
+        return Coalesce(models.Subquery(count), 0)
+
+    Note.objects.update(
+        like_count = reaction_count(Note.likes),
+        announce_count = reaction_count(Note.announces),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0010_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='announce_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_reactions, migrations.RunPython.noop),
+    ]
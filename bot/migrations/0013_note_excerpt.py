@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:16
+
+from bot.html_text import html_to_text
+from django.db import migrations, models
+
+
+def make_excerpts(apps, schema_editor):
+    Note = apps.get_model('bot', 'Note')
+    field = Note._meta.get_field('excerpt')
+
+    notes = []
+    for note in Note.objects.only('uid', 'data').iterator():
+        note.excerpt = html_to_text(note.data.get('content') or '', max_length = field.max_length)
+        notes.append(note)
+        if len(notes) == 1000:
+            Note.objects.bulk_update(notes, ['excerpt'])
+            notes = []
+    Note.objects.bulk_update(notes, ['excerpt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0012_note_reaction_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.RunPython(make_excerpts, migrations.RunPython.noop),
+    ]
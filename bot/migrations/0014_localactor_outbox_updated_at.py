@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+
+def set_outbox_updated_at(apps, schema_editor):
+    LocalActor = apps.get_model('bot', 'LocalActor')
+    Note = apps.get_model('bot', 'Note')
+
+    last_updated = Note.objects.filter(local_actor = models.OuterRef('pk')).order_by('-updated_at').values('updated_at')[:1]
+    LocalActor.objects.update(outbox_updated_at = models.Subquery(last_updated))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0013_note_excerpt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='localactor',
+            name='outbox_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_outbox_updated_at, migrations.RunPython.noop),
+    ]
@@ -1,23 +1,36 @@
 from   . import activitystreams
+from   . import keys
 from   . import tasks
 from   . import webfinger
 from   .activitystreams import ordered_collection, with_context
 from   .absolute_url import absolute_reverse, absolute_resolve
+from   .actor_documents import actor_documents
+from   .caching import LRUCache, SingleFlight
+from   .delivery import delivery_setting, host_pause, is_retryable_status, retry_delay
+from   .html_text import html_to_text
 from   .inbox import InboxHandler, InboxException
-import bs4
+from   .send_signed_message import encode_body, signed_post
 from   django.conf import settings
+from   django.core.exceptions import ValidationError
 from   django.core.files.base import ContentFile
 from   django.db import models
+from   django.db.models.functions import Coalesce
 from   django.dispatch import receiver
 from   django.utils.module_loading import import_string
 from   django.utils.timezone import now
+from   datetime import timedelta
+import concurrent.futures
 import functools
 import json
+import logging
+import operator
 from   pathlib import Path
 import re
 import urllib.parse
 import uuid
 
+logger = logging.getLogger(__name__)
+
 def default_empty():
     return {}
 
@@ -73,13 +86,47 @@ def local_actor_dir(instance, filename):
     p.mkdir(exist_ok = True, parents=True)
     return p / filename
 
+class LocalActorManager(models.Manager):
+    cache = LRUCache(maxsize = 128, ttl = 60)
+
+    def get_cached(self, pk):
+        """
+            Get an actor by its ID, from a short-lived per-process cache when possible.
+            Used by tasks, which are given actor IDs rather than actor objects.
+        """
+        actor = self.cache.get(pk)
+        if actor is None:
+            actor = self.get(pk = pk)
+            self.cache.set(pk, actor)
+        return actor
+
+# Usernames which can't be given to a local actor, because their URLs are used by other views.
+RESERVED_USERNAMES = {'inbox'}
+
 class LocalActor(AbstractActor):
+    objects = LocalActorManager()
+
     private_key_file = models.FileField(upload_to = local_actor_dir)
     public_key_file = models.FileField(upload_to = local_actor_dir)
     actor_json_file = models.FileField(upload_to = local_actor_dir, null=True, blank=True)
 
+    # When a follower was last added or removed, for validating cached copies of the followers collection.
+    followers_updated_at = models.DateTimeField(null = True, blank = True)
+
+    # When a note in the outbox was last created, changed or deleted, for validating cached copies of the outbox.
+    outbox_updated_at = models.DateTimeField(null = True, blank = True)
+
     inbox_handler_cls = InboxHandler
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('username','domain'), name='unique_local_actor')
+        ]
+
+    def clean(self):
+        if self.username in RESERVED_USERNAMES:
+            raise ValidationError({'username': f'The username "{self.username}" is reserved.'})
+
     def fill_in_bits(self):
         self.actor_json_file.save(
             'actor.json', 
@@ -109,13 +156,19 @@ class LocalActor(AbstractActor):
                 format=serialization.PublicFormat.SubjectPublicKeyInfo
             ))
         )
+        keys.private_keys.invalidate(self)
+        actor_documents.invalidate(self)
 
-
-    @functools.cache
     def get_private_key(self):
         with self.private_key_file.open('rb') as f:
             return f.read()
 
+    def get_private_key_object(self):
+        """
+            The parsed private key, from the per-process key cache.
+        """
+        return keys.private_keys.get(self)
+
     @functools.cache
     def get_public_key(self):
         with self.public_key_file.open('rb') as f:
@@ -131,6 +184,9 @@ class LocalActor(AbstractActor):
             "followers": self.get_followers_url(),
             "inbox": self.get_inbox_url(),
             "outbox": self.get_outbox_url(),
+            "endpoints": {
+                "sharedInbox": self.get_shared_inbox_url(),
+            },
             "publicKey": {
                 "id": self.get_public_key_url(),
                 "owner": self.get_absolute_url(),
@@ -140,12 +196,18 @@ class LocalActor(AbstractActor):
 
         return data
 
+    def actor_document(self):
+        """
+            The actor's document, serialized, from the actor document cache.
+        """
+        return actor_documents.get(self)
+
     def display_name(self):
-        data = self.actor_json()
+        data = self.actor_document().data
         return data.get('name', data.get('preferredUsername', self.username))
 
     def icon_url(self):
-        data = self.actor_json()
+        data = self.actor_document().data
         return data.get('icon', {}).get('url')
 
     def get_absolute_url(self):
@@ -154,6 +216,9 @@ class LocalActor(AbstractActor):
     def get_inbox_url(self):
         return absolute_reverse('user_inbox', username=self.username, domain=self.domain)
 
+    def get_shared_inbox_url(self):
+        return absolute_reverse('shared_inbox', domain=self.domain)
+
     def get_followers_url(self):
         return absolute_reverse('user_followers', username=self.username, domain=self.domain)
 
@@ -161,31 +226,60 @@ class LocalActor(AbstractActor):
         return absolute_reverse('user_outbox', username=self.username, domain=self.domain)
 
     def send_to_followers(self, message):
-        self.distribute_message(message, self.followers.all())
+        self.distribute_message(message, self.followers.all(), to = [self.get_followers_url()])
 
     def get_public_key_url(self):
         return self.get_absolute_url() + '#main-key'
 
     def send_signed_message(self, inbox_url, message):
-        return tasks.send_message(inbox_url, message, self.private_key, self.get_public_key_url())
+        activity = OutgoingActivity.objects.create_from_message(self, message)
+        activity.deliver([inbox_url])
 
     @ordered_collection()
     def followers_json(self):
-        followers = (f.get_absolute_url() for f in self.followers.all())
-        return followers, self.followers.count(), self.get_followers_url()
+        follow_relations = self.follow_relations.select_related('remote_actor')
+        return follow_relations, 'follow_date', lambda f: f.remote_actor.get_absolute_url(), self.get_followers_url()
 
     def send_to_inbox(self, remote_actor, message):
         message = message.copy()
         message['to'] = [remote_actor.get_absolute_url()]
         return self.send_signed_message(remote_actor.get_inbox_url(), message)
 
-    def distribute_message(self, message, recipients):
-        recipients = list(set(recipients))
+    def get_inbox_urls(self, recipients):
+        """
+            The inboxes to deliver a message to, so that each of the given remote actors receives it.
+
+            Recipients whose servers advertise a shared inbox are grouped together, so the message is delivered once per shared inbox.
+            Recipients without a shared inbox get the message in their personal inbox.
+        """
+        inbox_urls = set()
 
         for recipient in recipients:
-            self.send_to_inbox(recipient, message)
+            inbox_urls.add(recipient.get_shared_inbox_url() or recipient.get_inbox_url())
+
+        inbox_urls.discard(None)
+
+        return inbox_urls
+
+    def distribute_message(self, message, recipients, to = None):
+        """
+            Send a message to each of the given remote actors.
+
+            The message is serialized and its digest computed once for the whole batch: only the signature is made for each inbox.
+
+            :param: to - the list of addresses to put in the message's ``to`` field. If not given, the recipients' URLs are used.
+        """
+        recipients = list(set(recipients))
+
+        message = message.copy()
+        message['to'] = to if to is not None else [recipient.get_absolute_url() for recipient in recipients]
+
+        activity = OutgoingActivity.objects.create_from_message(self, message)
+        activity.deliver(self.get_inbox_urls(recipients))
 
     def update_profile(self):
+        actor_documents.invalidate(self)
+
         message = activitystreams.add_context({
             "summary": f'{self.username} updated its profile',
             "type": 'Update',
@@ -203,7 +297,293 @@ class LocalActor(AbstractActor):
 
     @ordered_collection()
     def outbox_json(self):
-        return (n.note_json() for n in self.notes.all()), self.notes.count(), self.get_outbox_url()
+        return self.notes.all(), 'published_date', lambda n: n.note_json(), self.get_outbox_url()
+
+class OutgoingActivityManager(models.Manager):
+    cache = LRUCache(maxsize = 64)
+
+    def create_from_message(self, actor, message):
+        body, digest = encode_body(message)
+        return self.create(actor = actor, body = body, digest = digest)
+
+    def get_cached(self, pk):
+        """
+            Get an activity by its ID, from a per-process cache when possible.
+            Activities don't change once they're created, so a fan-out to many inboxes only loads the activity once per worker.
+        """
+        activity = self.cache.get(pk)
+        if activity is None:
+            activity = self.get(pk = pk)
+            self.cache.set(pk, activity)
+        return activity
+
+class OutgoingActivity(models.Model):
+    """
+        A serialized message to be delivered by the send_message task.
+
+        Tasks refer to an activity by its ID, so the message isn't copied into the task queue for every recipient.
+    """
+    objects = OutgoingActivityManager()
+
+    actor = models.ForeignKey(LocalActor, related_name='outgoing_activities', on_delete=models.CASCADE)
+    body = models.BinaryField()
+    digest = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add = True)
+
+    def __str__(self):
+        return f'Activity {self.pk} from {self.actor}'
+
+    def deliver(self, inbox_urls):
+        """
+            Record a delivery of this activity to each of the given inboxes, and queue them to be sent.
+        """
+        lease_expires = now() + timedelta(seconds = delivery_setting('LEASE'))
+
+        deliveries = Delivery.objects.bulk_create([
+            Delivery(
+                activity = self,
+                inbox_url = inbox_url,
+                domain = urllib.parse.urlparse(inbox_url).netloc,
+                next_attempt_at = lease_expires,
+            )
+            for inbox_url in inbox_urls
+        ])
+
+        for delivery in deliveries:
+            delivery.enqueue()
+
+class DeliveryHost(models.Model):
+    """
+        Tracks failed deliveries to a remote host, so that a host which keeps failing can be paused.
+    """
+    domain = models.CharField(max_length = 200, unique = True)
+    consecutive_failures = models.PositiveIntegerField(default = 0)
+    paused_until = models.DateTimeField(null = True, blank = True)
+    last_failure_at = models.DateTimeField(null = True, blank = True)
+
+    def __str__(self):
+        return self.domain
+
+    @classmethod
+    def claim_attempt(cls, domain):
+        """
+            Can a delivery be made to this domain now?
+
+            While a host is paused, nothing is sent to it.
+            Once the pause has ended, only the first caller gets to send a delivery, as a probe: the pause is extended until that delivery succeeds or fails.
+
+            Returns a pair ``(allowed, retry_at)``, where ``retry_at`` is the time a refused delivery should be tried again.
+        """
+        try:
+            host = cls.objects.get(domain = domain)
+        except cls.DoesNotExist:
+            return True, None
+
+        if host.paused_until is None:
+            return True, None
+
+        time = now()
+        if host.paused_until > time:
+            return False, host.paused_until
+
+        probe_until = time + timedelta(seconds = delivery_setting('LEASE'))
+        claimed = cls.objects.filter(pk = host.pk, paused_until = host.paused_until).update(paused_until = probe_until)
+        if claimed:
+            return True, None
+        else:
+            return False, probe_until
+
+    @classmethod
+    def record_success(cls, domain):
+        cls.objects.filter(domain = domain).update(consecutive_failures = 0, paused_until = None)
+
+    @classmethod
+    def record_failure(cls, domain):
+        host, created = cls.objects.get_or_create(domain = domain)
+        cls.objects.filter(pk = host.pk).update(consecutive_failures = models.F('consecutive_failures') + 1, last_failure_at = now())
+        host.refresh_from_db()
+
+        if host.consecutive_failures >= delivery_setting('HOST_FAILURE_THRESHOLD'):
+            host.paused_until = now() + timedelta(seconds = host_pause(host.consecutive_failures))
+            host.save(update_fields = ['paused_until'])
+
+class Delivery(models.Model):
+    """
+        The delivery of an outgoing activity to one inbox.
+
+        While a delivery is pending, ``next_attempt_at`` is the time the scheduler should queue it again.
+        A queued delivery holds a lease until then, so that it's retried if its task is lost.
+
+        Each task is given the ``next_attempt_at`` it was queued with, as a token for its lease.
+        An attempt only goes ahead if it can claim the delivery with that token, so if the scheduler has queued the delivery again, only one of its tasks sends it.
+    """
+    PENDING = 'pending'
+    DELIVERED = 'delivered'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (DELIVERED, 'Delivered'),
+        (FAILED, 'Failed'),
+    ]
+
+    activity = models.ForeignKey(OutgoingActivity, related_name='deliveries', on_delete=models.CASCADE)
+    inbox_url = models.URLField(max_length = 500)
+    domain = models.CharField(max_length = 200)
+    status = models.CharField(max_length = 20, choices = STATUS_CHOICES, default = PENDING)
+    attempts = models.PositiveIntegerField(default = 0)
+    next_attempt_at = models.DateTimeField(null = True, blank = True)
+    last_attempt_at = models.DateTimeField(null = True, blank = True)
+    last_error = models.TextField(blank = True)
+
+    class Meta:
+        verbose_name_plural = 'deliveries'
+        constraints = [
+            models.UniqueConstraint(fields=('activity','inbox_url'), name='unique_delivery_per_inbox')
+        ]
+        indexes = [
+            models.Index(fields=('status','next_attempt_at'), name='delivery_schedule'),
+        ]
+
+    def __str__(self):
+        return f'{self.activity} to {self.inbox_url}'
+
+    def enqueue(self):
+        return tasks.send_message(self.inbox_url, self.pk, self.next_attempt_at)
+
+    def claim(self, lease):
+        """
+            Take this delivery for an attempt, if it's still pending and still has the lease it was queued with.
+            The lease is extended for the attempt, so the scheduler doesn't queue it again while it's being sent.
+        """
+        if self.status != Delivery.PENDING:
+            return False
+
+        claimed_until = now() + timedelta(seconds = delivery_setting('LEASE'))
+        deliveries = Delivery.objects.filter(pk = self.pk, status = Delivery.PENDING)
+        if lease is not None:
+            deliveries = deliveries.filter(next_attempt_at = lease)
+        if not deliveries.update(next_attempt_at = claimed_until):
+            return False
+
+        self.next_attempt_at = claimed_until
+        return True
+
+    def attempt(self, lease = None):
+        """
+            Try to send this delivery, and record the outcome.
+            ``lease`` is the ``next_attempt_at`` the delivery was queued with: if it's changed, another task has been queued for this delivery and this attempt does nothing.
+        """
+        if not self.claim(lease):
+            return
+
+        allowed, retry_at = DeliveryHost.claim_attempt(self.domain)
+        if not allowed:
+            self.next_attempt_at = retry_at
+            self.save(update_fields = ['next_attempt_at'])
+            return
+
+        activity = OutgoingActivity.objects.get_cached(self.activity_id)
+        actor = LocalActor.objects.get_cached(activity.actor_id)
+
+        self.attempts += 1
+        self.last_attempt_at = now()
+
+        try:
+            response = signed_post(self.inbox_url, actor.get_private_key_object(), actor.get_public_key_url(), body = bytes(activity.body), digest = activity.digest)
+        except Exception as e:
+            self.record_failure(str(e), retry = True)
+            DeliveryHost.record_failure(self.domain)
+            return
+
+        if response.ok:
+            self.status = Delivery.DELIVERED
+            self.next_attempt_at = None
+            self.last_error = ''
+            self.save()
+            DeliveryHost.record_success(self.domain)
+        elif is_retryable_status(response.status_code):
+            self.record_failure(f'HTTP {response.status_code}', retry = True)
+            DeliveryHost.record_failure(self.domain)
+        else:
+            self.record_failure(f'HTTP {response.status_code}', retry = False)
+            DeliveryHost.record_success(self.domain)
+
+    def record_failure(self, error, retry):
+        self.last_error = error
+        if retry and self.attempts < delivery_setting('MAX_ATTEMPTS'):
+            self.next_attempt_at = now() + timedelta(seconds = retry_delay(self.attempts))
+        else:
+            self.status = Delivery.FAILED
+            self.next_attempt_at = None
+        self.save()
+
+class InboundActivityManager(models.Manager):
+    def create_and_enqueue(self, recipient, activity):
+        inbound_activity = self.create(recipient = recipient, data = activity)
+        tasks.handle_inbound_activity(inbound_activity.pk, inbound_activity.queued_at)
+        return inbound_activity
+
+class InboundActivity(models.Model):
+    """
+        An activity received in an inbox, waiting to be handled by a worker.
+
+        Once it's handled successfully, it's deleted.
+        If a handler fails, the error is recorded and the activity is kept until it's cleaned up.
+    """
+    objects = InboundActivityManager()
+
+    recipient = models.ForeignKey(LocalActor, related_name='inbound_activities', on_delete=models.CASCADE)
+    data = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add = True)
+    queued_at = models.DateTimeField(auto_now_add = True)
+    failed_at = models.DateTimeField(null = True, blank = True)
+    error = models.TextField(blank = True)
+
+    class Meta:
+        verbose_name_plural = 'inbound activities'
+
+    def __str__(self):
+        return f'{self.data.get("type")} from {self.data.get("actor")} to {self.recipient}'
+
+    def claim(self, lease):
+        """
+            Take this activity for handling, if it hasn't failed and still has the ``queued_at`` it was queued with.
+            If it's been queued again since, the newer task handles it instead. Claiming sets ``queued_at`` to now, so it isn't queued again while it's being handled.
+        """
+        claimed_at = now()
+        activities = InboundActivity.objects.filter(pk = self.pk, failed_at = None)
+        if lease is not None:
+            activities = activities.filter(queued_at = lease)
+        if not activities.update(queued_at = claimed_at):
+            return False
+
+        self.queued_at = claimed_at
+        return True
+
+    def process(self):
+        from .inbox import handle_activity
+
+        RemoteActor.objects.mark_seen(activitystreams.object_id(self.data.get('actor')))
+
+        try:
+            handle_activity(self.recipient, self.data)
+        except Exception as e:
+            self.failed_at = now()
+            self.error = str(e)
+            self.save(update_fields = ['failed_at', 'error'])
+            raise
+
+        self.delete()
+
+class SeenActivity(models.Model):
+    """
+        A record that a local actor has received an activity, used by ``bot.dedup`` to spot duplicates.
+
+        The key is a hash of the recipient's ID and the activity's ``id``.
+    """
+    key = models.CharField(max_length = 64, unique = True)
+    seen_at = models.DateTimeField(auto_now_add = True, db_index = True)
 
 class AccessToken(models.Model):
     actor = models.ForeignKey(LocalActor, related_name='access_tokens', on_delete=models.CASCADE)
@@ -211,36 +591,186 @@ class AccessToken(models.Model):
     name = models.CharField(max_length=200)
 
 class RemoteActorManager(models.Manager):
+    """
+        Remote actors are looked up first in a per-process cache, then in the database, and finally fetched from their server.
+
+        A failed fetch is remembered for ``REMOTE_ACTOR_FAILURE_TTL`` seconds, so an unreachable actor isn't fetched again on every lookup.
+        Simultaneous lookups of the same actor in one process share a single fetch.
+    """
+    cache = LRUCache(maxsize = 2048, ttl = 5*60)
+    failures = LRUCache(maxsize = 2048, ttl = getattr(settings, 'REMOTE_ACTOR_FAILURE_TTL', 10*60))
+    fetches = SingleFlight()
+
     def create_from_profile_data(self, profile_data):
         url = profile_data['id']
         username = profile_data['preferredUsername']
         domain = urllib.parse.urlparse(url).netloc
-        return RemoteActor.objects.create(
-            username = username,
-            domain = domain,
-            url = url, 
-            profile = profile_data,
+        remote_actor, created = RemoteActor.objects.get_or_create(
+            url = url,
+            defaults = {
+                'username': username,
+                'domain': domain,
+                'profile': profile_data,
+                'fetched_at': now(),
+            }
         )
+        return remote_actor
+
+    def remember(self, remote_actor, *keys):
+        for key in keys + (('url', remote_actor.url), ('acct', remote_actor.username, remote_actor.domain)):
+            self.cache.set(key, remote_actor)
+            self.failures.delete(key)
+
+    def resolve(self, key, lookup, fetch):
+        remote_actor = self.cache.get(key)
+        if remote_actor is not None:
+            return remote_actor
+
+        error = self.failures.get(key)
+        if error is not None:
+            raise RemoteActor.DoesNotExist(error)
+
+        def load():
+            try:
+                remote_actor = self.get(**lookup)
+            except RemoteActor.DoesNotExist:
+                try:
+                    remote_actor = fetch()
+                except Exception as e:
+                    error = f'Could not fetch the remote actor {key}: {e}'
+                    self.failures.set(key, error)
+                    raise RemoteActor.DoesNotExist(error) from e
+
+            self.remember(remote_actor, key)
+            return remote_actor
+
+        return self.fetches.do(key, load)
 
     def get_by_url(self, url):
-        try:
-            return self.get(url=url)
-        except RemoteActor.DoesNotExist:
+        def fetch():
             profile_data = webfinger.fetch_remote_profile(url)
             return self.create_from_profile_data(profile_data)
 
+        return self.resolve(('url', url), {'url': url}, fetch)
+
     def get_by_username_domain(self, username, domain):
-        try:
-            return self.get(username = username, domain = domain)
-        except RemoteActor.DoesNotExist:
+        def fetch():
             remote_data = webfinger.webfinger(username, domain)
+            if remote_data is None or remote_data['profile'] is None:
+                raise webfinger.WebfingerException(f'No profile found for @{username}@{domain}')
             return self.create_from_profile_data(remote_data['profile'])
 
+        return self.resolve(('acct', username, domain), {'username': username, 'domain': domain}, fetch)
+
+    def get_many_by_username_domain(self, handles, timeout = None):
+        """
+            Look up several remote actors by username and domain at once.
+
+            Actors already in the cache or the database are loaded with one query.
+            The rest are fetched from their servers in parallel, giving up on any which haven't been fetched after ``timeout`` seconds.
+
+            Returns a dictionary mapping ``(username, domain)`` to ``RemoteActor``, containing only the actors which were found, in the order they were first given.
+        """
+        if timeout is None:
+            timeout = getattr(settings, 'MENTION_RESOLUTION_TIMEOUT', 10)
+
+        handles = list(dict.fromkeys(handles))
+
+        found = {}
+        missing = set()
+        for handle in handles:
+            key = ('acct',) + handle
+            remote_actor = self.cache.get(key)
+            if remote_actor is not None:
+                found[handle] = remote_actor
+            elif self.failures.get(key) is None:
+                missing.add(handle)
+
+        if missing:
+            query = functools.reduce(operator.or_, (models.Q(username = username, domain = domain) for username, domain in missing))
+            for remote_actor in self.filter(query):
+                handle = (remote_actor.username, remote_actor.domain)
+                if handle in missing:
+                    found[handle] = remote_actor
+                    missing.discard(handle)
+                    self.remember(remote_actor)
+
+        if not missing:
+            return {handle: found[handle] for handle in handles if handle in found}
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers = min(len(missing), 8))
+        futures = {executor.submit(webfinger.webfinger, username, domain): (username, domain) for username, domain in missing}
+        done, not_done = concurrent.futures.wait(futures, timeout = timeout)
+        executor.shutdown(wait = False, cancel_futures = True)
+
+        for future in done:
+            handle = futures[future]
+            key = ('acct',) + handle
+            try:
+                remote_data = future.result()
+                if remote_data is None or remote_data['profile'] is None:
+                    raise webfinger.WebfingerException(f'No profile found for @{handle[0]}@{handle[1]}')
+                profile_data = remote_data['profile']
+                try:
+                    remote_actor = self.get(url = profile_data['id'])
+                except RemoteActor.DoesNotExist:
+                    remote_actor = self.create_from_profile_data(profile_data)
+            except Exception as e:
+                self.failures.set(key, f'Could not fetch the remote actor {key}: {e}')
+                continue
+
+            self.remember(remote_actor, key)
+            found[handle] = remote_actor
+
+        return {handle: found[handle] for handle in handles if handle in found}
+
+    def refetch_by_url(self, url):
+        """
+            Fetch an actor's profile again, updating the stored copy, or creating it if it's not stored yet.
+        """
+        profile_data = webfinger.fetch_remote_profile(url)
+        updated = self.filter(url = url).update(profile = profile_data, fetched_at = now())
+        if updated:
+            remote_actor = self.get(url = url)
+        else:
+            remote_actor = self.create_from_profile_data(profile_data)
+
+        self.remember(remote_actor)
+        return remote_actor
+
+    def mark_seen(self, url):
+        """
+            Record that an actor has just sent us an activity.
+            To save writes, the time is only updated if it's more than an hour old.
+        """
+        time = now()
+        self.filter(url = url).filter(models.Q(last_seen_at = None) | models.Q(last_seen_at__lt = time - timedelta(hours = 1))).update(last_seen_at = time)
+
+    def stale(self):
+        """
+            Remote actors whose profiles are due to be fetched again.
+
+            Actors who follow a local actor come first, then those who have sent us an activity most recently, then those which were fetched longest ago.
+        """
+        max_age = timedelta(seconds = getattr(settings, 'REMOTE_ACTOR_REFRESH_AGE', 24*60*60))
+        is_follower = models.Exists(Follower.objects.filter(remote_actor = models.OuterRef('pk')))
+
+        return (
+            self
+            .filter(models.Q(fetched_at = None) | models.Q(fetched_at__lt = now() - max_age))
+            .annotate(is_follower = is_follower)
+            .order_by('-is_follower', models.F('last_seen_at').desc(nulls_last = True), models.F('fetched_at').asc(nulls_first = True))
+        )
+
 class RemoteActor(AbstractActor):
     objects = RemoteActorManager()
 
-    url = models.URLField(max_length = 500)
+    url = models.URLField(max_length = 500, unique = True)
     profile = models.JSONField(default = default_empty)
+    fetched_at = models.DateTimeField(null = True, blank = True)
+    etag = models.CharField(max_length = 200, blank = True)
+    last_modified = models.CharField(max_length = 100, blank = True)
+    last_seen_at = models.DateTimeField(null = True, blank = True)
 
     following = models.ManyToManyField(
         LocalActor, 
@@ -249,15 +779,61 @@ class RemoteActor(AbstractActor):
         through_fields = ('remote_actor', 'following')
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=('username','domain'), name='remote_actor_handle'),
+        ]
+
     def get_absolute_url(self):
         return self.url
 
+    def refresh_profile(self):
+        """
+            Fetch this actor's profile again, if it's changed since it was last fetched.
+
+            The fetch time is updated even if the fetch fails, so that an unreachable actor doesn't hold up the others.
+        """
+        self.fetched_at = now()
+
+        try:
+            profile_data, self.etag, self.last_modified = webfinger.fetch_remote_profile_if_changed(self.url, self.etag, self.last_modified)
+        except Exception:
+            logger.exception(f'Could not refresh the profile of {self.url}')
+            self.save(update_fields = ['fetched_at'])
+            return
+
+        update_fields = ['fetched_at', 'etag', 'last_modified']
+
+        if profile_data is not None and profile_data.get('id') == self.url:
+            self.profile = profile_data
+            update_fields.append('profile')
+
+        self.save(update_fields = update_fields)
+        RemoteActor.objects.remember(self)
+
     def icon_url(self):
         return self.profile.get('icon',{}).get('url')
 
     def get_inbox_url(self):
         return self.profile.get('inbox')
 
+    def get_shared_inbox_url(self):
+        return self.profile.get('endpoints', {}).get('sharedInbox')
+
+    def get_public_key_data(self):
+        public_key = self.profile.get('publicKey', {})
+        if isinstance(public_key, list):
+            public_key = public_key[0] if public_key else {}
+        return public_key
+
+    def get_public_key(self):
+        pem = self.get_public_key_data().get('publicKeyPem')
+        if pem is not None:
+            return pem.encode('utf-8')
+
+    def get_public_key_url(self):
+        return self.get_public_key_data().get('id')
+
     def display_name(self):
         return self.profile.get('name')
 
@@ -270,6 +846,10 @@ class Follower(models.Model):
         constraints = [
             models.UniqueConstraint(fields=('remote_actor','following'), name='unique_followers_per_actor')
         ]
+        indexes = [
+            # For paging through an actor's followers, newest first.
+            models.Index(fields=('following','-follow_date','-id'), name='follower_by_date'),
+        ]
 
 reserved = r':/\?#\[\]@!\$\&\'\(\)\*\+,;=\s'
 re_mention = re.compile(r'(?<!\S)@(?P<username>[^'+reserved+']+)@(?P<domain>[^'+reserved+r']+)(?<!\.)(?=$|\.|['+reserved+'])')
@@ -290,13 +870,7 @@ def apply_mentions(data):
         domain = m.group('domain')
         mentioned.append((username, domain))
 
-    unique_mentioned = {}
-    for (username, domain) in mentioned:
-        try:
-            remote_actor = RemoteActor.objects.get_by_username_domain(username, domain)
-            unique_mentioned[(username, domain)] = remote_actor
-        except Exception:
-            pass
+    unique_mentioned = RemoteActor.objects.get_many_by_username_domain(mentioned)
 
     def sub_mention(m):
         username = m.group('username')
@@ -313,7 +887,11 @@ def apply_mentions(data):
 
     tags = data.setdefault('tag',[])
 
-    for ((username, domain), account) in unique_mentioned.items():
+    # Tags are added in the order the actors are first mentioned, so the note's JSON is the same each time it's built.
+    for (username, domain) in dict.fromkeys(mentioned):
+        account = unique_mentioned.get((username, domain))
+        if account is None:
+            continue
         tags.append({
             "type": "Mention",
             "href": account.get_absolute_url(),
@@ -322,7 +900,14 @@ def apply_mentions(data):
 
     return data
 
-class NoteManager(models.Manager):
+class NoteQuerySet(models.QuerySet):
+    def for_json(self):
+        """
+            Load everything that displaying a note or building its JSON needs, so showing a page of notes takes a fixed number of queries however long the page is.
+        """
+        return self.select_related('local_actor', 'remote_actor', 'in_reply_to__local_actor').prefetch_related('to')
+
+class NoteManager(models.Manager.from_queryset(NoteQuerySet)):
     def get_by_absolute_url(self, url):
         try:
             m = absolute_resolve(url)
@@ -334,6 +919,9 @@ class NoteManager(models.Manager):
         uid = m.kwargs['uid']
         return self.get(uid=uid)
 
+# The maximum length of a note's plain text excerpt.
+EXCERPT_LENGTH = 200
+
 class Note(models.Model):
     objects = NoteManager()
 
@@ -345,17 +933,31 @@ class Note(models.Model):
     to = models.ManyToManyField(RemoteActor, related_name='received_notes', blank=True)
     likes = models.ManyToManyField(RemoteActor, related_name='likes', blank=True)
     announces = models.ManyToManyField(RemoteActor, related_name='announces', blank=True)
+    # The number of likes and announces, kept up to date by update_reaction_counts so that showing them doesn't need a query.
+    like_count = models.PositiveIntegerField(default = 0, editable = False)
+    announce_count = models.PositiveIntegerField(default = 0, editable = False)
     public = models.BooleanField(default=True)
     mentions = models.ManyToManyField(LocalActor, related_name='mentions', blank=True)
 
     updated_at = models.DateTimeField(null = True, auto_now = True)
 
+    # The start of the note's content as plain text, for showing in lists and logs. It's set whenever the note is saved.
+    excerpt = models.CharField(max_length = EXCERPT_LENGTH, blank = True, editable = False)
+
+    # The note's JSON, as returned by build_note_json, serialized. It's rebuilt whenever the note is saved or its recipients change.
+    rendered_json = models.TextField(blank = True, editable = False)
+
     in_reply_to = models.ForeignKey('self', null=True, blank=True, related_name='replies', on_delete=models.SET_NULL)
 
     filters = [nl2br, apply_mentions,]
 
     class Meta:
         ordering = ['-published_date']
+        indexes = [
+            # For paging through an actor's notes, newest first.
+            models.Index(fields=('local_actor','-published_date','-uid'), name='note_local_actor_by_date'),
+            models.Index(fields=('remote_actor','-published_date','-uid'), name='note_remote_actor_by_date'),
+        ]
 
     @property
     def actor(self):
@@ -366,7 +968,10 @@ class Note(models.Model):
             return absolute_reverse('note', username=self.local_actor.username, domain=self.local_actor.domain, uid=str(self.uid))
 
     def __str__(self):
-        return bs4.BeautifulSoup(self.data.get('content',''), 'html.parser').text
+        return self.excerpt
+
+    def make_excerpt(self):
+        return html_to_text(self.data.get('content') or '', max_length = EXCERPT_LENGTH)
 
     def content(self):
         return self.data.get('content')
@@ -400,7 +1005,7 @@ class Note(models.Model):
         return note
 
     @activitystreams.with_context()
-    def note_json(self):
+    def build_note_json(self):
         data = self.data.copy()
         
         if self.local_actor:
@@ -416,6 +1021,29 @@ class Note(models.Model):
 
         return data
 
+    def render(self):
+        """
+            Build this note's JSON and store it, so that reading the note doesn't have to build it again.
+            ``updated_at`` is set as well, because it's what cached copies of the JSON are validated against.
+        """
+        self.rendered_json = json.dumps(self.build_note_json())
+        self.updated_at = now()
+        Note.objects.filter(pk = self.pk).update(rendered_json = self.rendered_json, updated_at = self.updated_at)
+        if self.local_actor_id:
+            touch_outbox([self.local_actor_id], self.updated_at)
+
+    def get_rendered_json(self):
+        """
+            This note's JSON, serialized.
+            Notes which were created without being saved, such as by ``bulk_create``, have no stored JSON, so it's built for them.
+        """
+        if not self.rendered_json:
+            return json.dumps(self.build_note_json())
+        return self.rendered_json
+
+    def note_json(self):
+        return json.loads(self.get_rendered_json())
+
     def add_unique_id(self, message):
         return activitystreams.add_unique_id(self.actor.domain, message)
 
@@ -451,13 +1079,105 @@ class Note(models.Model):
             }
         }
 
+@receiver(models.signals.post_save, sender=LocalActor)
+@receiver(models.signals.post_delete, sender=LocalActor)
+def local_actor_changed(sender, instance, **kwargs):
+    from .shared_inbox import local_actor_index
+    local_actor_index.clear()
+
+def touch_followers(local_actor_pks):
+    LocalActor.objects.filter(pk__in = local_actor_pks).update(followers_updated_at = now())
+
+def touch_outbox(local_actor_pks, time = None):
+    LocalActor.objects.filter(pk__in = local_actor_pks).update(outbox_updated_at = time or now())
+
+def reaction_count(relation):
+    through = relation.through
+    count = through.objects.filter(note = models.OuterRef('pk')).order_by().values('note').annotate(n = models.Count('*')).values('n')
+    return Coalesce(models.Subquery(count), 0)
+
+def update_reaction_counts(note_pks):
+    """
+        Count the likes and announces of the given notes again, in a single query.
+    """
+    if not note_pks:
+        return
+    Note.objects.filter(pk__in = note_pks).update(
+        like_count = reaction_count(Note.likes),
+        announce_count = reaction_count(Note.announces),
+    )
+
+@receiver(models.signals.m2m_changed, sender=Note.likes.through)
+@receiver(models.signals.m2m_changed, sender=Note.announces.through)
+def reactions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            update_reaction_counts([instance.pk])
+    elif action == 'pre_clear':
+        instance.cleared_reaction_notes = set(sender.objects.filter(remoteactor = instance).values_list('note_id', flat = True))
+    elif action == 'post_clear':
+        update_reaction_counts(getattr(instance, 'cleared_reaction_notes', set()))
+    elif action in ('post_add', 'post_remove'):
+        update_reaction_counts(pk_set)
+
+@receiver(models.signals.pre_delete, sender=RemoteActor)
+def remote_actor_reactions_deleted(sender, instance, **kwargs):
+    instance.reacted_notes = set(instance.likes.values_list('pk', flat = True)) | set(instance.announces.values_list('pk', flat = True))
+
+@receiver(models.signals.post_delete, sender=RemoteActor)
+def remote_actor_deleted(sender, instance, **kwargs):
+    update_reaction_counts(getattr(instance, 'reacted_notes', set()))
+
+@receiver(models.signals.m2m_changed, sender=Follower)
+def followers_added(sender, instance, action, reverse, pk_set, **kwargs):
+    # Removing followers deletes Follower objects, which is handled by followers_changed below.
+    if action != 'post_add':
+        return
+    if isinstance(instance, LocalActor):
+        touch_followers([instance.pk])
+    else:
+        touch_followers(pk_set)
+
+@receiver(models.signals.post_save, sender=Follower)
+@receiver(models.signals.post_delete, sender=Follower)
+def followers_changed(sender, instance, **kwargs):
+    touch_followers([instance.following_id])
+
+@receiver(models.signals.pre_save, sender=Note)
+def note_excerpt(sender, instance, raw, **kwargs):
+    if not raw:
+        instance.excerpt = instance.make_excerpt()
+
 @receiver(models.signals.post_save, sender=Note)
-def note_delete_activity(sender, instance, created, **kwargs):
+def note_delete_activity(sender, instance, created, raw, **kwargs):
     note = instance
+    if raw:
+        # Loading a fixture: the stored JSON is loaded with the note, and the objects it refers to might not have been loaded yet.
+        note.loading_fixture = True
+        return
+    note.render()
     if not created:
         note.actor.send_to_followers(note.update_json())
 
+@receiver(models.signals.m2m_changed, sender=Note.to.through)
+def note_recipients_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        notes = Note.objects.filter(pk__in = pk_set) if pk_set is not None else Note.objects.none()
+    elif getattr(instance, 'loading_fixture', False):
+        return
+    else:
+        notes = [instance]
+    for note in notes:
+        note.render()
+
 @receiver(models.signals.pre_delete, sender=Note)
 def note_delete_activity(sender, instance, **kwargs):
     note = instance
     note.actor.send_to_followers(note.delete_json())
+
+@receiver(models.signals.post_delete, sender=Note)
+def note_deleted(sender, instance, **kwargs):
+    if instance.local_actor_id:
+        touch_outbox([instance.local_actor_id])
@@ -1,20 +1,30 @@
 # from https://github.com/HelgeKrueger/bovine/blob/975855232b74dca2a6f55358a9f3f5647e9c0717/bovine/clients/signed_http.py
 
 import base64
+import binascii
+from cryptography.exceptions import InvalidSignature
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding, rsa
 from cryptography.hazmat.primitives.serialization import (load_pem_private_key,load_pem_public_key)
 from datetime import datetime, timedelta, timezone
 from dateutil.parser import parse
 import hashlib
-import requests
+import json
+import re
 from   urllib.parse import urlparse
+from   .delivery import get_delivery_engine
 
 def get_gmt_now() -> str:
     return datetime.utcnow().strftime("%a, %d %b %Y %H:%M:%S GMT")
 
 def sign_message(private_key, message):
-    key = load_pem_private_key(private_key, password=None)
+    """
+        ``private_key`` is either an ``RSAPrivateKey`` object, or the bytes of a PEM-encoded key.
+    """
+    if isinstance(private_key, rsa.RSAPrivateKey):
+        key = private_key
+    else:
+        key = load_pem_private_key(private_key, password=None)
 
     return base64.standard_b64encode(
         key.sign(
@@ -24,6 +34,36 @@ def sign_message(private_key, message):
         )
     ).decode("utf-8")
 
+def verify_signature(public_key, message, signature):
+    """
+        Check a base64-encoded signature of a message.
+        ``public_key`` is either an ``RSAPublicKey`` object, or the bytes of a PEM-encoded key.
+    """
+    if isinstance(public_key, rsa.RSAPublicKey):
+        key = public_key
+    else:
+        key = load_pem_public_key(public_key)
+
+    try:
+        key.verify(
+            base64.standard_b64decode(signature),
+            message.encode("utf-8"),
+            padding.PKCS1v15(),
+            hashes.SHA256(),
+        )
+    except (InvalidSignature, binascii.Error, ValueError):
+        return False
+
+    return True
+
+re_signature_param = re.compile(r'(?P<name>\w+)="(?P<value>[^"]*)"')
+
+def parse_signature_header(header):
+    """
+        Parse the value of a ``Signature`` header into a dictionary with keys such as ``keyId``, ``algorithm``, ``headers`` and ``signature``.
+    """
+    return {m.group('name'): m.group('value') for m in re_signature_param.finditer(header)}
+
 class HttpSignature:
     def __init__(self):
         self.fields = []
@@ -61,6 +101,12 @@ def content_digest_sha256(content):
     digest = base64.standard_b64encode(hashlib.sha256(content).digest()).decode("utf-8")
     return "SHA-256=" + digest
 
+def encode_body(message):
+    """
+        Serialize a message for sending, returning the body bytes and their digest.
+    """
+    body = json.dumps(message).encode("utf-8")
+    return body, content_digest_sha256(body)
 
 def build_signature(host, method, target):
     return (
@@ -68,7 +114,8 @@ def build_signature(host, method, target):
         .with_field("(request-target)", f"{method} {target}")
         .with_field("host", host)
     )
-def signed_post(url, private_key, public_key_url, headers = None, body = None):
+
+def signed_post(url, private_key, public_key_url, headers = None, body = None, digest = None):
     headers = {} if headers is None else headers
 
     parsed_url = urlparse(url)
@@ -79,7 +126,8 @@ def signed_post(url, private_key, public_key_url, headers = None, body = None):
     content_type = "application/activity+json"
     date_header = get_gmt_now()
 
-    digest = content_digest_sha256(body)
+    if digest is None:
+        digest = content_digest_sha256(body)
 
     signature_header = (
         build_signature(host, "post", target)
@@ -97,5 +145,5 @@ def signed_post(url, private_key, public_key_url, headers = None, body = None):
     headers["signature"] = signature_header
     headers["user-agent"] = "CLPs activitypub bot"
 
-    response = requests.post(url, data = body, headers = headers)
+    response = get_delivery_engine().post(url, data = body, headers = headers)
     return response
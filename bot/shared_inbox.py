@@ -0,0 +1,125 @@
+"""
+    Routing activities received by the shared inbox to the local actors they concern.
+"""
+
+from   .absolute_url import absolute_resolve
+from   .activitystreams import object_id
+from   .caching import LRUCache
+from   .inbox import InboxException
+from   urllib.parse import urlparse
+
+# The fields of an activity, or of the object it acts on, which can contain addresses of local actors.
+ADDRESS_FIELDS = ['to', 'cc', 'bto', 'bcc', 'audience']
+
+def as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+def addresses(value):
+    """
+        The URLs in an addressing field, which holds a URL or an object with an ``id``, or a list of them.
+        Raises InboxException if any of them isn't a URL.
+    """
+    urls = [object_id(v) for v in as_list(value)]
+    if not all(isinstance(url, str) for url in urls):
+        raise InboxException('The activity has a malformed addressing field')
+    return urls
+
+def candidate_urls(activity):
+    """
+        All the URLs in an activity which might identify a local actor, or an object belonging to one.
+
+        These are the activity's addressees, its object, and for an embedded object, the object's addressees, the object it replies to, and the actors mentioned in its tags.
+        For an activity such as Undo whose object is another activity, the inner activity's object is included too.
+        Values which aren't strings are ignored, except in the addressing fields, where they're an error.
+    """
+    urls = []
+
+    for field in ADDRESS_FIELDS:
+        urls.extend(addresses(activity.get(field)))
+
+    obj = activity.get('object')
+    urls.append(object_id(obj))
+
+    if isinstance(obj, dict):
+        for field in ADDRESS_FIELDS:
+            urls.extend(addresses(obj.get(field)))
+        urls.append(object_id(obj.get('object')))
+        urls.append(object_id(obj.get('inReplyTo')))
+        urls.extend(tag.get('href') for tag in as_list(obj.get('tag')) if isinstance(tag, dict))
+
+    return {url for url in urls if isinstance(url, str)}
+
+class LocalActorIndex:
+    """
+        An index of the URLs of the local actors on each domain, used to work out which of them an activity is for.
+
+        The index for a domain is built the first time it's needed, and rebuilt when a local actor is saved or deleted, or after ``ttl`` seconds so that other processes pick up changes.
+    """
+
+    def __init__(self, ttl = 5*60):
+        self.indexes = LRUCache(maxsize = 128, ttl = ttl)
+
+    def build_index(self, domain):
+        from .models import LocalActor
+
+        by_url = {}
+        by_username = {}
+        for actor in LocalActor.objects.filter(domain = domain):
+            by_url[actor.get_absolute_url()] = actor.pk
+            by_url[actor.get_inbox_url()] = actor.pk
+            by_url[actor.get_followers_url()] = actor.pk
+            by_username[actor.username] = actor.pk
+
+        return by_url, by_username
+
+    def get_index(self, domain):
+        index = self.indexes.get(domain)
+        if index is None:
+            index = self.build_index(domain)
+            self.indexes.set(domain, index)
+        return index
+
+    def clear(self):
+        self.indexes.clear()
+
+    def lookup(self, domain, url):
+        """
+            The ID of the local actor that the given URL identifies or belongs to, or None.
+        """
+        by_url, by_username = self.get_index(domain)
+
+        pk = by_url.get(url)
+        if pk is not None:
+            return pk
+
+        if urlparse(url).netloc != domain:
+            return
+
+        try:
+            match = absolute_resolve(url)
+        except Exception:
+            return
+
+        username = match.kwargs.get('username')
+        if username is not None:
+            return by_username.get(username)
+
+    def get_recipients(self, domain, activity):
+        """
+            The local actors on the given domain who should receive the given activity.
+        """
+        from .models import LocalActor
+
+        pks = {self.lookup(domain, url) for url in candidate_urls(activity)}
+        pks.discard(None)
+
+        if not pks:
+            return []
+
+        return list(LocalActor.objects.filter(pk__in = pks))
+
+local_actor_index = LocalActorIndex()
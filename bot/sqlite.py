@@ -0,0 +1,34 @@
+"""
+    Settings applied to every new SQLite connection, so that the web server and the task runner can write to the database at the same time.
+
+    - ``journal_mode=WAL`` lets readers carry on while another process writes.
+    - ``synchronous=NORMAL`` only syncs to disk at checkpoints, which is safe in WAL mode: a power cut can lose the last few transactions but can't corrupt the database.
+    - ``busy_timeout`` makes a connection wait for a lock, rather than failing straight away with "database is locked".
+    - ``mmap_size`` lets SQLite read the database through memory-mapped I/O.
+"""
+
+from   django.conf import settings
+from   django.db.backends.signals import connection_created
+from   django.dispatch import receiver
+
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 256*1024*1024,
+}
+
+def get_pragmas():
+    pragmas = DEFAULT_SQLITE_PRAGMAS.copy()
+    pragmas.update(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    return pragmas
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for name, value in get_pragmas().items():
+            if value is not None:
+                cursor.execute(f'PRAGMA {name} = {value}')
@@ -1,61 +1,180 @@
 from   . import activitystreams
-from   .send_signed_message import signed_post
+from   .delivery import delivery_setting
+from   datetime import timedelta
+from   django.conf import settings
 from   django.utils import dateparse
-from   huey.contrib.djhuey import task
-import json
+from   django.utils.timezone import now
+from   huey import crontab
+from   huey.contrib.djhuey import periodic_task, task
+
+# The number of days to keep sent activities for.
+DEFAULT_OUTGOING_ACTIVITY_RETENTION_DAYS = 7
+
+# The number of minutes after which a received activity which hasn't been handled is queued again.
+INBOUND_ACTIVITY_REQUEUE_MINUTES = 15
+
+# The number of days to keep received activities whose handlers failed.
+FAILED_INBOUND_ACTIVITY_RETENTION_DAYS = 7
+
+def get_actor(actor_pk):
+    from .models import LocalActor
+    return LocalActor.objects.get_cached(actor_pk)
 
 @task()
-def update_profile(actor):
-    actor.update_profile()
+def update_profile(actor_pk):
+    get_actor(actor_pk).update_profile()
 
 @task()
-def send_message(inbox_url, message, private_key_pem, public_key_url):
-    signed_post(inbox_url, private_key_pem, public_key_url, body = json.dumps(message))
+def send_message(inbox_url, delivery_pk, lease = None):
+    """
+        Make an attempt at a delivery of a stored outgoing activity.
+
+        The inbox URL is passed as well as the delivery's ID so that workers can tell which domain the task delivers to without loading it.
+        ``lease`` is the delivery's ``next_attempt_at`` when it was queued: see ``Delivery.claim``.
+    """
+    from .models import Delivery
+    try:
+        delivery = Delivery.objects.get(pk = delivery_pk)
+    except Delivery.DoesNotExist:
+        return
+
+    delivery.attempt(lease)
+
+@periodic_task(crontab(minute='*'))
+def retry_deliveries():
+    """
+        Queue the pending deliveries which are due to be tried again, apart from those to paused hosts.
+    """
+    from .models import Delivery, DeliveryHost
+
+    time = now()
+    paused_domains = DeliveryHost.objects.filter(paused_until__gt = time).values('domain')
+    due = (
+        Delivery.objects
+        .filter(status = Delivery.PENDING, next_attempt_at__lte = time)
+        .exclude(domain__in = paused_domains)
+        .order_by('next_attempt_at')
+    )[:delivery_setting('RETRY_BATCH_SIZE')]
+
+    lease_expires = time + timedelta(seconds = delivery_setting('LEASE'))
+
+    for delivery in due:
+        claimed = Delivery.objects.filter(pk = delivery.pk, next_attempt_at = delivery.next_attempt_at).update(next_attempt_at = lease_expires)
+        if claimed:
+            delivery.next_attempt_at = lease_expires
+            delivery.enqueue()
+
+@periodic_task(crontab(minute='0', hour='3'))
+def delete_old_outgoing_activities():
+    """
+        Delete old sent activities. Activities which still have deliveries waiting to be tried are kept, so those deliveries end by being sent or marked as failed rather than disappearing.
+    """
+    from .models import Delivery, OutgoingActivity
+    retention_days = getattr(settings, 'OUTGOING_ACTIVITY_RETENTION_DAYS', DEFAULT_OUTGOING_ACTIVITY_RETENTION_DAYS)
+    (
+        OutgoingActivity.objects
+        .filter(created_at__lt = now() - timedelta(days = retention_days))
+        .exclude(deliveries__status = Delivery.PENDING)
+        .delete()
+    )
+
+@task()
+def handle_inbound_activity(inbound_activity_pk, lease = None):
+    """
+        Handle a stored received activity.
+
+        ``lease`` is the activity's ``queued_at`` when it was queued: see ``InboundActivity.claim``.
+    """
+    from .models import InboundActivity
+    try:
+        inbound_activity = InboundActivity.objects.select_related('recipient').get(pk = inbound_activity_pk, failed_at = None)
+    except InboundActivity.DoesNotExist:
+        return
+
+    if not inbound_activity.claim(lease):
+        return
+
+    inbound_activity.process()
+
+@periodic_task(crontab(minute='*/5'))
+def requeue_inbound_activities():
+    """
+        Queue received activities again if their tasks seem to have been lost, and clean up old failed activities.
+    """
+    from .models import InboundActivity
+
+    time = now()
+
+    stale = InboundActivity.objects.filter(failed_at = None, queued_at__lt = time - timedelta(minutes = INBOUND_ACTIVITY_REQUEUE_MINUTES))
+    for pk in stale.values_list('pk', flat = True):
+        claimed = stale.filter(pk = pk).update(queued_at = time)
+        if claimed:
+            handle_inbound_activity(pk, time)
+
+    InboundActivity.objects.filter(failed_at__lt = time - timedelta(days = FAILED_INBOUND_ACTIVITY_RETENTION_DAYS)).delete()
+
+@periodic_task(crontab(minute='30'))
+def delete_expired_seen_activities():
+    from .dedup import deduplicator
+    deduplicator.delete_expired()
+
+@periodic_task(crontab(minute='*/10'))
+def refresh_remote_actors():
+    """
+        Fetch the profiles of a batch of remote actors whose stored copies are out of date.
+    """
+    from .models import RemoteActor
+
+    batch_size = getattr(settings, 'REMOTE_ACTOR_REFRESH_BATCH_SIZE', 50)
+    for remote_actor in RemoteActor.objects.stale()[:batch_size]:
+        remote_actor.refresh_profile()
 
 @task()
-def add_follower(actor, follower_url, accept_message):
+def add_follower(actor_pk, follower_url, accept_message):
     from .models import RemoteActor
+    actor = get_actor(actor_pk)
     remote_actor = RemoteActor.objects.get_by_url(follower_url)
     actor.followers.add(remote_actor)
 
     actor.send_signed_message(remote_actor.get_inbox_url(), accept_message)
 
 @task()
-def remove_follower(actor, follower_url):
+def remove_follower(actor_pk, follower_url):
     from .models import RemoteActor
+    actor = get_actor(actor_pk)
     remote_actor = RemoteActor.objects.get_by_url(follower_url)
     actor.followers.remove(remote_actor)
 
 @task()
-def add_like(actor, activity):
+def add_like(actor_pk, activity):
     from .models import Note, RemoteActor
     note = Note.objects.get_by_absolute_url(activity['object'])
     remote_actor = RemoteActor.objects.get_by_url(activity['actor'])
     note.likes.add(remote_actor)
 
 @task()
-def remove_like(actor, activity):
+def remove_like(actor_pk, activity):
     from .models import Note, RemoteActor
     note = Note.objects.get_by_absolute_url(activity['object']['object'])
     remote_actor = RemoteActor.objects.get_by_url(activity['actor'])
     note.likes.remove(remote_actor)
 
 @task()
-def add_announce(actor, activity):
+def add_announce(actor_pk, activity):
     from .models import Note, RemoteActor
     note = Note.objects.get_by_absolute_url(activity['object'])
     remote_actor = RemoteActor.objects.get_by_url(activity['actor'])
     note.announces.add(remote_actor)
 
 @task()
-def remove_announce(actor, activity):
+def remove_announce(actor_pk, activity):
     from .models import Note, RemoteActor
     note = Note.objects.get_by_absolute_url(activity['object']['object'])
     remote_actor = RemoteActor.objects.get_by_url(activity['actor'])
     note.announces.remove(remote_actor)
 
 @task()
-def save_mention(recipient, activity):
+def save_mention(recipient_pk, activity):
     from .models import Note, RemoteActor
 
     remote_actor_url = activity['actor']
@@ -75,4 +194,4 @@ def save_mention(recipient, activity):
         in_reply_to = in_reply_to
     )
 
-    note.mentions.add(recipient)
+    note.mentions.add(recipient_pk)
@@ -1,3 +1,125 @@
-from django.test import TestCase
+from   .models import LocalActor, Note
+from   django.core.cache import cache
+from   django.test import TestCase, override_settings
+from   django.urls import reverse
+from   urllib.parse import urlparse
+import json
+import os
+import tempfile
 
-# Create your tests here.
+def url_path(url):
+    """
+        The path and query string of an absolute URL, for the test client.
+    """
+    parts = urlparse(url)
+    return parts.path + ('?' + parts.query if parts.query else '')
+
+class QueryCountTest(TestCase):
+    """
+        Each page takes the same number of queries however many notes are on it.
+    """
+
+    def setUp(self):
+        # The actor's key and actor.json files are written under a temporary directory.
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        self.addCleanup(os.chdir, cwd)
+
+        settings_override = override_settings(MEDIA_ROOT = self.tmpdir.name, ACTORS_DIR = 'actors')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        cache.clear()
+
+        self.actor = LocalActor.objects.create(username = 'bot', domain = 'testserver')
+        self.actor.fill_in_bits()
+
+    def make_notes(self, num):
+        return [Note.create(self.actor, f'<p>Note {i}</p>') for i in range(num)]
+
+    def get(self, url, **kwargs):
+        return self.client.get(url_path(url), **kwargs)
+
+    def test_outbox(self):
+        for num_notes, total in [(1, 1), (4, 5), (20, 25)]:
+            with self.subTest(num_notes = num_notes):
+                self.make_notes(num_notes)
+
+                # Load the actor, count the notes, and load the first page.
+                with self.assertNumQueries(3):
+                    response = self.get(self.actor.get_outbox_url(), HTTP_ACCEPT = 'application/activity+json')
+                self.assertEqual(response.status_code, 200)
+                data = response.json()
+                self.assertEqual(data['totalItems'], total)
+                self.assertEqual(len(data['first']['orderedItems']), min(total, 20))
+
+                with self.assertNumQueries(2):
+                    response = self.get(self.actor.get_outbox_url() + '?page=true', HTTP_ACCEPT = 'application/activity+json')
+                self.assertEqual(response.status_code, 200)
+
+                next_url = response.json().get('next')
+                if next_url is not None:
+                    with self.assertNumQueries(2):
+                        response = self.get(next_url, HTTP_ACCEPT = 'application/activity+json')
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.json()['orderedItems']), total - 20)
+
+    def test_outbox_changes_when_note_deleted(self):
+        note, = self.make_notes(1)
+        etag = self.get(self.actor.get_outbox_url(), HTTP_ACCEPT = 'application/activity+json')['ETag']
+
+        note.delete()
+
+        response = self.get(self.actor.get_outbox_url(), HTTP_ACCEPT = 'application/activity+json', HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['totalItems'], 0)
+
+    def test_profile(self):
+        with self.assertNumQueries(1):
+            response = self.get(self.actor.get_absolute_url(), HTTP_ACCEPT = 'application/activity+json')
+        self.assertEqual(response.status_code, 200)
+
+        for num_notes in [1, 4, 10]:
+            with self.subTest(num_notes = num_notes):
+                self.make_notes(num_notes)
+
+                # The first page of the HTML profile has up to 5 notes.
+                with self.assertNumQueries(6):
+                    response = self.get(self.actor.get_absolute_url(), HTTP_ACCEPT = 'text/html')
+                self.assertEqual(response.status_code, 200)
+
+    def test_note(self):
+        for content in ['<p>Short</p>', '<p>' + 'Long '*10000 + '</p>']:
+            with self.subTest(length = len(content)):
+                note = Note.create(self.actor, content)
+
+                with self.assertNumQueries(2):
+                    response = self.get(note.get_absolute_url(), HTTP_ACCEPT = 'application/activity+json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['content'], content)
+
+                with self.assertNumQueries(4):
+                    response = self.get(note.get_absolute_url(), HTTP_ACCEPT = 'text/html')
+                self.assertEqual(response.status_code, 200)
+
+@override_settings(VERIFY_INBOX_SIGNATURES = False, ASYNC_INBOX = True)
+class SharedInboxTest(TestCase):
+    def post(self, activity):
+        return self.client.post(reverse('shared_inbox'), json.dumps(activity), content_type = 'application/activity+json')
+
+    def test_malformed_addressing(self):
+        for to in [[{'id': ['https://example.com/a']}], [None], [['https://example.com/a']]]:
+            with self.subTest(to = to):
+                response = self.post({'type': 'Create', 'actor': 'https://example.com/a', 'id': 'https://example.com/1', 'to': to})
+                self.assertEqual(response.status_code, 400)
+
+    def test_other_fields_which_are_not_urls_are_ignored(self):
+        response = self.post({
+            'type': 'Create',
+            'actor': 'https://example.com/a',
+            'id': 'https://example.com/2',
+            'object': {'inReplyTo': ['https://example.com/b'], 'object': [1], 'tag': [{'href': ['https://example.com/c']}]},
+        })
+        self.assertEqual(response.status_code, 202)
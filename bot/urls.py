@@ -6,6 +6,10 @@ urlpatterns = [
         views.guidview,
         name='guid'
     ),
+    path('inbox',
+        views.SharedInboxView.as_view(),
+        name='shared_inbox'
+    ),
     path('<str:username>',
         views.ProfileView.as_view(),
         name='user_profile'
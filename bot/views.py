@@ -1,17 +1,32 @@
+from   . import activitystreams
 from   .absolute_url import absolute_reverse
-from   .inbox import InboxException, get_inbox_handlers
-from   .models import LocalActor, RemoteActor, Note
+from   .dedup import deduplicator
+from   .http_signatures import SignatureException, verify_request
+from   .inbox import InboxException, handle_activity
+from   .models import LocalActor, RemoteActor, Note, InboundActivity
+from   .shared_inbox import local_actor_index
 from   django.conf import settings
 from   django.core.exceptions import PermissionDenied
 from   django.core.paginator import Paginator
 from   django.views.decorators.csrf import csrf_exempt
 from   django.http import HttpResponse, JsonResponse, HttpResponseBadRequest, HttpResponseNotFound
 from   django.shortcuts import render, redirect
+from   django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 from   django.utils.decorators import method_decorator
+from   django.utils.http import http_date
 from   django.views import View
+import hashlib
 import json
 import re
 
+# How long in seconds caches and proxies may keep each kind of ActivityPub document before checking that it's still current.
+DEFAULT_CACHE_MAX_AGE = {
+    'profile': 5*60,
+    'note': 5*60,
+    'outbox': 60,
+    'followers': 60,
+}
+
 # Create your views here.
 
 def testview(request):
@@ -78,12 +93,55 @@ class RequireTokenMixin:
 
         return super().dispatch(request, *args, **kwargs)
 
+def make_etag(*parts):
+    return '"' + hashlib.sha256(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:32] + '"'
+
+def timestamp(dt):
+    return int(dt.timestamp()) if dt is not None else None
+
+class ConditionalGetMixin:
+    """
+        For views of ActivityPub documents: answer conditional requests with '304 Not Modified', and tell caches how long they may keep a response.
+
+        Responses vary on the Accept header, because some of these views show HTML to browsers.
+    """
+
+    cache_name = None
+
+    def get_cache_max_age(self):
+        max_ages = getattr(settings, 'CACHE_MAX_AGE', {})
+        return max_ages.get(self.cache_name, DEFAULT_CACHE_MAX_AGE[self.cache_name])
+
+    def conditional_response(self, etag, last_modified, make_response):
+        """
+            If the client's copy is current, a '304 Not Modified' response; otherwise the response that ``make_response`` returns.
+        """
+        response = get_conditional_response(self.request, etag = etag, last_modified = last_modified)
+        if response is None:
+            response = make_response()
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public = True, max_age = self.get_cache_max_age())
+
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        patch_vary_headers(response, ['Accept'])
+        return response
+
 class ActorView(View):
     def get_actor(self):
         username = self.kwargs['username']
         return LocalActor.objects.get(username = username, domain = self.request.get_host())
 
-class ProfileView(ActorView):
+class ProfileView(ConditionalGetMixin, ActorView):
+    cache_name = 'profile'
+
     def get_template_names(self):
         actor = self.get_actor()
 
@@ -96,15 +154,20 @@ class ProfileView(ActorView):
     def get(self, request, *args, **kwargs):
         actor = self.get_actor()
 
-        paginator = Paginator(actor.notes.all(), 5)
+        if self.request.accepts('text/html'):
+            paginator = Paginator(actor.notes.for_json(), 5)
 
-        page_number = request.GET.get('page')
-        page = paginator.get_page(page_number)
+            page_number = request.GET.get('page')
+            page = paginator.get_page(page_number)
 
-        if self.request.accepts('text/html'):
-            return render(self.request, self.get_template_names(), {'actor': actor, 'profile': actor.actor_json(), 'page': page,})
+            return render(self.request, self.get_template_names(), {'actor': actor, 'profile': actor.actor_document().data, 'page': page,})
         else:
-            return JsonResponse(actor.actor_json(), content_type='application/activity+json')
+            document = actor.actor_document()
+            return self.conditional_response(
+                document.etag,
+                document.last_modified,
+                lambda: HttpResponse(document.body, content_type='application/activity+json')
+            )
 
 class UpdateProfileView(ActorView):
     http_method_names = ['post']
@@ -113,56 +176,167 @@ class UpdateProfileView(ActorView):
         from . import tasks
 
         actor = self.get_actor()
-        tasks.update_profile(actor)
+        tasks.update_profile(actor.pk)
         
         return redirect(actor.get_absolute_url())
 
-class FollowersView(ActorView):
+class CollectionPageMixin(ConditionalGetMixin):
+    """
+        For views of an OrderedCollection: read which page is wanted from the query string.
+    """
+    def get_page_kwargs(self):
+        return {
+            'page': 'page' in self.request.GET,
+            'max_id': self.request.GET.get('max_id'),
+            'min_id': self.request.GET.get('min_id'),
+        }
+
+    def get_collection(self, actor):
+        raise NotImplementedError
+
+    def get_last_modified(self, actor):
+        """
+            When the collection last changed, and a version string which changes whenever its contents do.
+        """
+        raise NotImplementedError
+
     def get(self, request, *args, **kwargs):
         actor = self.get_actor()
-        json = actor.followers_json()
-        return JsonResponse(json)
+        last_modified, version = self.get_last_modified(actor)
+
+        def make_response():
+            try:
+                json = self.get_collection(actor)(**self.get_page_kwargs())
+            except ValueError:
+                return HttpResponseBadRequest('Invalid page cursor')
+            return JsonResponse(json)
+
+        return self.conditional_response(make_etag(actor.pk, version), timestamp(last_modified), make_response)
+
+class FollowersView(CollectionPageMixin, ActorView):
+    cache_name = 'followers'
+
+    def get_collection(self, actor):
+        return actor.followers_json
+
+    def get_last_modified(self, actor):
+        updated_at = actor.followers_updated_at
+        return updated_at, updated_at.timestamp() if updated_at else None
+
+class BaseInboxView(CSRFExemptMixin, View):
+    def get_recipients(self, activity):
+        """
+            The local actors who should receive the given activity.
+        """
+        raise NotImplementedError
+
+    def verify_signature(self, activity):
+        """
+            Check that the request is signed by the actor who performed the activity.
+            Returns an error response if it isn't, or None if it is.
+        """
+        if not getattr(settings, 'VERIFY_INBOX_SIGNATURES', True):
+            return
+
+        try:
+            key_owner = verify_request(self.request)
+        except SignatureException as e:
+            if activity.get('type') == 'Delete':
+                # Servers send Delete activities for actors which no longer exist, so their keys can't be fetched. Nothing handles Delete, so just ignore it.
+                return HttpResponse('')
+            return HttpResponse(str(e), status = 401)
+
+        if key_owner != activitystreams.object_id(activity.get('actor')):
+            return HttpResponse('The request is not signed by the actor of the activity', status = 401)
 
-class InboxView(CSRFExemptMixin, ActorView):
     def post(self, request, *args, **kwargs):
-        activity = json.load(request)
+        try:
+            activity = json.loads(request.body)
+        except ValueError:
+            return HttpResponseBadRequest('The request body is not valid JSON')
 
-        actor = self.get_actor()
-        inbox_handlers = get_inbox_handlers(actor, activity)
+        if not isinstance(activity, dict):
+            return HttpResponseBadRequest('The request body is not a JSON object')
+
+        if 'type' not in activity or 'actor' not in activity:
+            return HttpResponseBadRequest('The activity is missing the type or actor field')
+
+        error_response = self.verify_signature(activity)
+        if error_response is not None:
+            return error_response
+
+        async_inbox = getattr(settings, 'ASYNC_INBOX', True)
 
         result = None
 
-        for inbox_handler in inbox_handlers:
-            try:
-                hresult = inbox_handler.handle(activity)
-                if hresult is not None:
-                    result = hresult
+        try:
+            recipients = self.get_recipients(activity)
+        except InboxException as e:
+            return HttpResponseBadRequest(str(e))
 
-            except InboxException as e:
-                pass
+        for actor in recipients:
+            if deduplicator.is_duplicate(actor, activity):
+                continue
 
-        if result is not None:
+            try:
+                if async_inbox:
+                    InboundActivity.objects.create_and_enqueue(actor, activity)
+                else:
+                    hresult = handle_activity(actor, activity)
+                    if hresult is not None:
+                        result = hresult
+            except Exception:
+                deduplicator.forget(actor, activity)
+                raise
+
+        if async_inbox:
+            return HttpResponse('', status = 202)
+        elif result is not None:
             return JsonResponse(result)
         else:
             return HttpResponse('')
 
-class OutboxView(ActorView):
-    def get(self, request, *args, **kwargs):
-        actor = self.get_actor()
-        json = actor.outbox_json()
-        return JsonResponse(json)
+class InboxView(BaseInboxView, ActorView):
+    def get_recipients(self, activity):
+        return [self.get_actor()]
+
+class SharedInboxView(BaseInboxView):
+    """
+        An inbox shared by all the actors on a domain.
+        Each activity is passed to the handlers of every local actor it's addressed to or concerns.
+    """
+    def get_recipients(self, activity):
+        return local_actor_index.get_recipients(self.request.get_host(), activity)
+
+class OutboxView(CollectionPageMixin, ActorView):
+    cache_name = 'outbox'
+
+    def get_collection(self, actor):
+        return actor.outbox_json
+
+    def get_last_modified(self, actor):
+        updated_at = actor.outbox_updated_at
+        return updated_at, updated_at.timestamp() if updated_at else None
+
+class NoteView(ConditionalGetMixin, ActorView):
+    cache_name = 'note'
 
-class NoteView(ActorView):
-    def get_note(self):
+    def get_note(self, notes):
         uid = self.kwargs['uid']
-        return self.get_actor().notes.get(uid = uid)
+        return notes.get(uid = uid)
 
     def get(self, request, *args, **kwargs):
-        note = self.get_note()
+        notes = self.get_actor().notes
 
         if self.kwargs.get('content-type') == 'json' or not self.request.accepts('text/html'):
-            return JsonResponse(note.note_json())
+            note = self.get_note(notes)
+            return self.conditional_response(
+                make_etag(note.uid, note.updated_at.timestamp() if note.updated_at else None),
+                timestamp(note.updated_at),
+                lambda: HttpResponse(note.get_rendered_json(), content_type='application/json')
+            )
         else:
+            note = self.get_note(notes.for_json())
             return render(self.request, 'note.html', {'note': note})
 
 class CreateNoteView(CSRFExemptMixin, RequireTokenMixin, ActorView):
@@ -8,7 +8,7 @@ remote_accounts_dir = Path('remote-accounts')
 
 class WebfingerException(Exception):
     def __init__(self, error):
-        super().__init__()
+        super().__init__(error)
         self.error = error
 
 def webfinger(username, domain):
@@ -47,8 +47,33 @@ def fetch_remote_profile(url):
         url,
         headers = {
             'Accept': 'application/json',
-        }
+        },
+        timeout = WEBFINGER_TIMEOUT,
     )
+    res.raise_for_status()
     profile_data = res.json()
 
     return profile_data
+
+def fetch_remote_profile_if_changed(url, etag = None, last_modified = None):
+    """
+        Fetch a remote profile with a conditional request, using validators from the last time it was fetched.
+
+        Returns a tuple ``(profile_data, etag, last_modified)``, where ``profile_data`` is None if the profile hasn't changed.
+    """
+    headers = {
+        'Accept': 'application/json',
+    }
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    res = requests.get(url, headers = headers, timeout = WEBFINGER_TIMEOUT)
+
+    if res.status_code == 304:
+        return None, etag, last_modified
+
+    res.raise_for_status()
+
+    return res.json(), res.headers.get('ETag', ''), res.headers.get('Last-Modified', '')